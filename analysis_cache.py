@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+
+# Bump whenever analyze_image starts producing different values, so stale
+# results from an older version are recomputed instead of reused
+CACHE_VERSION = 4
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Content hash of a file, read in chunks"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_cache(cache_path, params=None):
+    """
+    Load the per-image result store.
+    Returns an empty store if the file is missing, unreadable, from another version
+    or built with different analysis params.
+    """
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable cache {cache_path}: {e}")
+        return {}
+    if data.get("version") != CACHE_VERSION or data.get("params") != (params or {}):
+        return {}
+    return data.get("entries", {})
+
+def save_cache(entries, cache_path, params=None):
+    """Write the result store atomically so an interrupted run never leaves a broken file"""
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "params": params or {}, "entries": entries}, f)
+    os.replace(tmp_path, cache_path)
+
+def partition_cached(entries, image_paths):
+    """
+    Split image_paths into those whose cached result is still valid and those
+    that must be analysed again.
+
+    An entry is reused when size and mtime match. If only the stat changed
+    (e.g. the file was touched or re-copied) the content hash decides.
+    Returns (fresh, stale) where fresh maps path -> entry with up-to-date
+    stat fields and stale maps path -> (size, mtime_ns, content hash).
+    """
+    fresh = {}
+    stale = {}
+    for path in image_paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            # Missing file: analysed again so it is reported with its status
+            stale[path] = (None, None, None)
+            continue
+        entry = entries.get(path)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            fresh[path] = entry
+            continue
+
+        content_hash = file_hash(path)
+        if entry and entry["hash"] == content_hash:
+            fresh[path] = {**entry, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        else:
+            stale[path] = (st.st_size, st.st_mtime_ns, content_hash)
+    return fresh, stale
+
+def make_entry(signature, result):
+    """Build a store entry from a (size, mtime_ns, hash) signature and an analysis result"""
+    size, mtime_ns, content_hash = signature
+    return {"size": size, "mtime_ns": mtime_ns, "hash": content_hash, "result": result}
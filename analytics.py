@@ -0,0 +1,131 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+AGGREGATES_PATH = "filtered_nid_aggregates.json"
+AGGREGATES_VERSION = 1
+# Fixed bin edges, so cells from different batches line up and can simply be added
+BLUR_BINS = [0, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, np.inf]
+ANGLE_BINS = list(range(0, 185, 5))
+CELL_KEYS = ['vendor', 'blur_bin', 'angle_bin']
+
+def bin_labels(edges):
+    """Readable label of every bin, e.g. "500-750" and "5000+" for the open last bin"""
+    return [f"{low:g}+" if np.isinf(high) else f"{low:g}-{high:g}" for low, high in zip(edges[:-1], edges[1:])]
+
+def _bin(values, edges):
+    # Bin index of every value, -1 when missing or outside the edges
+    codes = pd.cut(values, edges, labels=False, right=False)
+    return np.nan_to_num(np.asarray(codes, dtype=np.float64), nan=-1).astype(np.int64)
+
+def compute_cells(df):
+    """
+    Additive statistics of df per (vendor, blur bin, angle bin) cell:
+    row count, then sum and non-missing count of detected_blur, detected_angle
+    and every *_accuracy column. Means of any group of cells, batches or
+    vendors follow from sums and counts without touching the rows again.
+    """
+    blur = df['detected_blur'].to_numpy(dtype=np.float64, na_value=np.nan)
+    angle = df['detected_angle'].to_numpy(dtype=np.float64, na_value=np.nan)
+    vendor = df['vendor'].astype("string").fillna("unknown") if 'vendor' in df.columns else "unknown"
+    frame = pd.DataFrame({
+        'vendor': vendor,
+        'blur_bin': _bin(blur, BLUR_BINS),
+        'angle_bin': _bin(angle, ANGLE_BINS),
+        'detected_blur': blur,
+        'detected_angle': angle,
+    }, index=df.index)
+    value_columns = ['detected_blur', 'detected_angle']
+    for column in df.columns:
+        if column.endswith('_accuracy'):
+            frame[column] = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            value_columns.append(column)
+
+    grouped = frame.groupby(CELL_KEYS, sort=True)
+    cells = grouped.size().rename('count').to_frame()
+    cells = cells.join(grouped[value_columns].sum().add_suffix('_sum'))
+    cells = cells.join(grouped[value_columns].count().add_suffix('_count'))
+    return cells.reset_index()
+
+def load_aggregates(path=AGGREGATES_PATH):
+    """{batch: {'source', 'updated', 'rows', 'cells'}} from path, or {} if missing or outdated"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable aggregates {path}: {e}")
+        return {}
+    if data.get("version") != AGGREGATES_VERSION or data.get("blur_bins") != _edges_json(BLUR_BINS) \
+            or data.get("angle_bins") != ANGLE_BINS:
+        return {}
+    return data.get("batches", {})
+
+def _edges_json(edges):
+    return [None if np.isinf(edge) else edge for edge in edges]
+
+def update_aggregates(df, batch, source=None, path=AGGREGATES_PATH):
+    """
+    Recompute the cells of one batch from its rows and store them next to the
+    other batches, which are left as they are. Written atomically.
+    """
+    batches = load_aggregates(path)
+    cells = compute_cells(df)
+    batches[batch] = {
+        'source': source,
+        'updated': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'rows': len(df),
+        'cells': cells.to_dict(orient="list"),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": AGGREGATES_VERSION, "blur_bins": _edges_json(BLUR_BINS), "angle_bins": ANGLE_BINS,
+                   "batches": batches}, f)
+    os.replace(tmp_path, path)
+    return batches
+
+def cells_frame(batches):
+    """All cells of all batches as one DataFrame with a batch column, oldest batch first"""
+    frames = [
+        pd.DataFrame(entry['cells']).assign(batch=batch)
+        for batch, entry in sorted(batches.items(), key=lambda item: item[1]['updated'])
+    ]
+    if not frames:
+        return pd.DataFrame(columns=['batch'] + CELL_KEYS + ['count'])
+    return pd.concat(frames, ignore_index=True)
+
+def summarise(cells, by, value_column):
+    """
+    Mean of value_column per group of cells (plus row counts), from the stored
+    sums and counts. by is a column name or list of names.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    totals = cells.groupby(by, sort=True)[['count', f"{value_column}_sum", f"{value_column}_count"]].sum()
+    counts = totals[f"{value_column}_count"]
+    totals['mean'] = totals[f"{value_column}_sum"] / counts.where(counts > 0)
+    return totals[['count', 'mean']].reset_index()
+
+def blur_threshold_table(cells, accuracy_column):
+    """
+    For every blur bin edge as a minimum-blur threshold: share of rows kept and
+    mean accuracy of the kept and of the rejected rows.
+    """
+    per_bin = cells[cells['blur_bin'] >= 0].groupby('blur_bin')[
+        ['count', f"{accuracy_column}_sum", f"{accuracy_column}_count"]].sum()
+    per_bin = per_bin.reindex(range(len(BLUR_BINS) - 1), fill_value=0)
+    total = per_bin.sum()
+    kept = per_bin[::-1].cumsum()[::-1]
+    rejected = total - kept
+    def mean(part):
+        counts = part[f"{accuracy_column}_count"]
+        return part[f"{accuracy_column}_sum"] / counts.where(counts > 0)
+    return pd.DataFrame({
+        'min_blur': BLUR_BINS[:-1],
+        'kept_share': kept['count'] / total['count'] if total['count'] else np.nan,
+        'kept_accuracy': mean(kept),
+        'rejected_accuracy': mean(rejected),
+    }).reset_index(drop=True)
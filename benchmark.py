@@ -0,0 +1,223 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import uuid
+
+import cv2
+import numpy as np
+import pandas as pd
+
+import check
+import create_filtered_csv
+
+NID_COLUMNS = [
+    'id', 'name_en', 'name_en_ocr_v6', 'name_bn', 'name_bn_ocr_v6', 'father_name', 'father_name_ocr_v6',
+    'mother_name', 'mother_name_ocr_v6', 'spouse_name', 'spouse_name_ocr_v6', 'address', 'address_ocr_v6',
+    'selfie_photo', 'person_photo', 'nid_image_front', 'nid_image_back', 'vendor', 'detected_angle',
+    'detected_blur', 'error_ocr_v6', 'upload_id', 'dob_ocr_v6', 'nid_no_ocr_v6', 'name_en_ocr_v6_accuracy',
+    'name_bn_ocr_v6_accuracy', 'father_name_ocr_v6_accuracy', 'mother_name_ocr_v6_accuracy',
+    'spouse_name_ocr_v6_accuracy', 'address_ocr_v6_accuracy',
+]
+BENGALI_WORDS = ["বাসা/হোল্ডিং:", "গ্রাম/রাস্তা:", "ডাকঘর:", "ঢাকা", "মিরপুর", "সদর", "পৌরসভা", "কসবা", "৪৫০", "১২১৬"]
+
+def make_card_crop(width=900, height=260, blur_sigma=0.0, angle=0.0, rng=None):
+    """
+    Synthetic address crop: light card background, several lines of dark
+    text-like strokes and a border, then rotated by angle degrees and blurred.
+    """
+    rng = rng or np.random.default_rng()
+    img = np.full((height, width, 3), rng.integers(200, 240), np.uint8)
+    cv2.rectangle(img, (4, 4), (width - 5, height - 5), (60, 60, 60), 2)
+    line_height = max(12, height // 6)
+    for y in range(line_height, height - line_height // 2, line_height):
+        x = 15
+        while x < width - 40:
+            word = int(rng.integers(20, 90))
+            cv2.rectangle(img, (x, y - line_height // 2), (min(x + word, width - 15), y), (30, 30, 30), -1)
+            x += word + int(rng.integers(8, 20))
+    if angle:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        img = cv2.warpAffine(img, matrix, (width, height), borderValue=(220, 220, 220))
+    if blur_sigma > 0:
+        img = cv2.GaussianBlur(img, (0, 0), blur_sigma)
+    noise = rng.normal(0, 3, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+def write_synthetic_images(image_dir, count, width, height, max_blur, max_angle, seed=0):
+    """Write count synthetic crops named <upload_id>.png; returns the upload_ids"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(image_dir, exist_ok=True)
+    upload_ids = []
+    for _ in range(count):
+        upload_id = str(uuid.UUID(bytes=rng.bytes(16), version=4))
+        crop = make_card_crop(width, height, rng.uniform(0, max_blur), rng.uniform(-max_angle, max_angle), rng)
+        cv2.imwrite(os.path.join(image_dir, f"{upload_id}.png"), crop)
+        upload_ids.append(upload_id)
+    return upload_ids
+
+def write_synthetic_nid_csv(csv_path, rows, upload_ids, seed=0):
+    """Synthetic NID CSV with the production column layout and N rows"""
+    rng = np.random.default_rng(seed)
+    def text(n):
+        return [" ".join(rng.choice(BENGALI_WORDS, int(rng.integers(3, 12)))) for _ in range(n)]
+    data = {column: text(rows) for column in NID_COLUMNS}
+    data['id'] = np.arange(1, rows + 1)
+    data['upload_id'] = rng.choice(np.asarray(upload_ids + [str(uuid.uuid4()) for _ in range(len(upload_ids) // 10 + 1)]), rows)
+    data['vendor'] = rng.choice(["vendor_a", "vendor_b", "vendor_c"], rows)
+    data['detected_blur'] = rng.uniform(50, 3000, rows)
+    data['detected_angle'] = rng.uniform(-90, 90, rows)
+    for column in NID_COLUMNS:
+        if column.endswith('_accuracy'):
+            data[column] = rng.uniform(0, 1, rows)
+    pd.DataFrame(data, columns=NID_COLUMNS).to_csv(csv_path, index=False)
+
+def latency_stats(samples):
+    """Latency percentiles in milliseconds"""
+    samples = np.asarray(samples) * 1000
+    return {
+        'calls': int(samples.size),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max()),
+    }
+
+def time_calls(function, args_list):
+    durations = []
+    for args in args_list:
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of finished children (Linux reports KiB)"""
+    scale = 1 / 1024 if platform.system() == "Linux" else 1 / (1024 * 1024)
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+def time_render_modes(app_path, modes=("Table View", "Card View", "Image Gallery"), repeats=3):
+    """
+    Time full script runs of the Streamlit app for each display mode, headless.
+    Returns None when streamlit is not installed.
+    """
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return None
+    app = AppTest.from_file(app_path, default_timeout=600)
+    app.run()
+    timings = {}
+    for mode in modes:
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            app.radio[0].set_value(mode).run()
+            durations.append(time.perf_counter() - start)
+        timings[mode] = latency_stats(durations)
+    return timings
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(images=200, rows=5000, width=900, height=260, max_blur=3.0, max_angle=10.0,
+                   workers=None, latency_samples=50, seed=0, render=True):
+    """Generate synthetic data in a temporary directory and time every stage on it"""
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'params': {'images': images, 'rows': rows, 'width': width, 'height': height, 'max_blur': max_blur,
+                   'max_angle': max_angle, 'workers': workers or os.cpu_count(), 'seed': seed},
+        'stages': {},
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="nid_bench_") as workdir:
+        os.chdir(workdir)
+        try:
+            start = time.perf_counter()
+            upload_ids = write_synthetic_images("address images", images, width, height, max_blur, max_angle, seed)
+            write_synthetic_nid_csv("nid.csv", rows, upload_ids, seed)
+            results['stages']['generate_s'] = time.perf_counter() - start
+
+            image_paths = [os.path.join("address images", f"{upload_id}.png") for upload_id in upload_ids]
+            sample = [(path,) for path in image_paths[:latency_samples]]
+            results['stages']['detect_blur_level'] = latency_stats(time_calls(check.detect_blur_level, sample))
+            results['stages']['detect_card_angle_fixed'] = latency_stats(time_calls(check.detect_card_angle_fixed, sample))
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                check.process_images_and_create_csv(csv_path="image_analysis_results.csv", workers=workers, cache_path=None)
+                analysis_s = time.perf_counter() - start
+            results['stages']['analysis'] = {'seconds': analysis_s, 'images_per_sec': images / analysis_s}
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                create_filtered_csv.create_filtered_csv(csv_file="nid.csv", output_file="filtered_nid_data_with_images.csv")
+                merge_s = time.perf_counter() - start
+            results['stages']['merge'] = {'seconds': merge_s, 'rows_per_sec': rows / merge_s}
+
+            if render:
+                app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+                results['stages']['render'] = time_render_modes(app_path)
+        finally:
+            os.chdir(cwd)
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+def compare(current, baseline):
+    """Print the relative change of every timing against a baseline report"""
+    def flatten(report, prefix=""):
+        values = {}
+        for key, value in report.items():
+            if isinstance(value, dict):
+                values.update(flatten(value, f"{prefix}{key}."))
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[f"{prefix}{key}"] = value
+        return values
+
+    old = flatten(baseline.get('stages', {}))
+    new = flatten(current.get('stages', {}))
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for key in sorted(set(old) & set(new)):
+        if old[key]:
+            print(f"  {key:45s} {old[key]:12.3f} -> {new[key]:12.3f} ({(new[key] - old[key]) / old[key]:+.1%})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmark for the analysis and merge stages")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--width", type=int, default=900)
+    parser.add_argument("--height", type=int, default=260)
+    parser.add_argument("--max-blur", type=float, default=3.0, help="max Gaussian sigma applied to crops")
+    parser.add_argument("--max-angle", type=float, default=10.0, help="max rotation in degrees")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-render", action="store_true", help="skip the Streamlit render timings")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.images, args.rows, args.width, args.height, args.max_blur, args.max_angle,
+                            args.workers, seed=args.seed, render=not args.no_render)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Results saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
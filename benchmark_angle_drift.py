@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from check import load_grayscale, compute_blur, compute_card_angle
+
+def angle_difference(a, b):
+    """Smallest difference between two line angles on the 180° circle"""
+    diff = np.abs(np.asarray(a, dtype=float) - np.asarray(b, dtype=float)) % 180
+    return np.minimum(diff, 180 - diff)
+
+def run_drift_benchmark(results_csv="image_analysis_results.csv", image_dir="address images",
+                        widths=(1024, 768, 640, 512, 384), limit=None):
+    """
+    Compare the downscaled angle path against the full-resolution detected_angle /
+    detected_blur values in results_csv, and time both paths on the same images.
+    Images are decoded once; only the angle/blur computation is timed.
+    """
+    reference = pd.read_csv(results_csv).dropna(subset=['detected_blur', 'detected_angle'])
+    reference['image_path'] = [os.path.join(image_dir, name) for name in reference['image_name']]
+    reference = reference[[os.path.exists(path) for path in reference['image_path']]]
+    if limit:
+        reference = reference.head(limit)
+    if reference.empty:
+        print(f"Error: No images from {results_csv} found in {image_dir}")
+        return None
+
+    grays = [load_grayscale(path) for path in reference['image_path']]
+    keep = [gray is not None for gray in grays]
+    reference = reference[keep]
+    grays = [gray for gray in grays if gray is not None]
+
+    report = {'images': len(grays), 'modes': {}}
+    full_time = None
+    for width in (None,) + tuple(widths):
+        start = time.perf_counter()
+        angles = [compute_card_angle(gray, width) for gray in grays]
+        elapsed = time.perf_counter() - start
+        if width is None:
+            full_time = elapsed
+            start = time.perf_counter()
+            blurs = [compute_blur(gray) for gray in grays]
+            blur_drift = np.abs(np.array(blurs) - reference['detected_blur'].to_numpy()) / np.maximum(reference['detected_blur'].to_numpy(), 1e-9)
+            report['blur'] = {
+                'ms_per_image': 1000 * (time.perf_counter() - start) / len(grays),
+                'mean_relative_drift': float(blur_drift.mean()),
+                'max_relative_drift': float(blur_drift.max()),
+            }
+
+        drift = angle_difference(angles, reference['detected_angle'])
+        report['modes']['full' if width is None else str(width)] = {
+            'ms_per_image': 1000 * elapsed / len(grays),
+            'speedup': full_time / elapsed if elapsed else None,
+            'mean_abs_angle_drift': float(np.nanmean(drift)),
+            'p95_abs_angle_drift': float(np.nanpercentile(drift, 95)),
+            'within_1_degree': float((drift <= 1).mean()),
+            'angle_not_found': float(np.isnan(drift).mean()),
+        }
+
+    print(f"Images compared: {report['images']}")
+    print(f"Blur: {report['blur']['ms_per_image']:.2f} ms/image, mean relative drift {report['blur']['mean_relative_drift']:.2e}")
+    print(f"{'mode':>6} {'ms/img':>8} {'speedup':>8} {'mean°':>7} {'p95°':>7} {'<=1°':>6}")
+    for mode, stats in report['modes'].items():
+        print(f"{mode:>6} {stats['ms_per_image']:8.2f} {stats['speedup']:8.2f} "
+              f"{stats['mean_abs_angle_drift']:7.2f} {stats['p95_abs_angle_drift']:7.2f} {stats['within_1_degree']:6.1%}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy drift and speed of the downscaled angle path")
+    parser.add_argument("--results", default="image_analysis_results.csv")
+    parser.add_argument("--image-dir", default="address images")
+    parser.add_argument("--widths", type=int, nargs="+", default=[1024, 768, 640, 512, 384])
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--output", default=None, help="optional JSON file for the report")
+    args = parser.parse_args()
+
+    report = run_drift_benchmark(args.results, args.image_dir, tuple(args.widths), args.limit)
+    if report and args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
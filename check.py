@@ -2,61 +2,154 @@ import cv2
 import numpy as np
 import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from tqdm import tqdm
 from math import degrees, atan2
+from analysis_cache import load_cache, save_cache, partition_cached, make_entry
+from extract_address_img import read_manifest
+from image_validation import probe_image, STATUS_OK, STATUS_ANGLE_NOT_FOUND, FILE_ERROR_STATUSES
+from tensor_store import TensorStore, build_tensor_store
+import instrumentation
+from instrumentation import timed
 
-def detect_blur_level(image_path):
+def load_grayscale(image_path):
     """
-    Detect blur level using only Laplacian variance.
-    Returns the blur score and a label ('blur' or 'clear').
+    Decode an image once and return it as a single grayscale buffer.
+    Returns None if the image cannot be read.
     """
-    img = cv2.imread(image_path)
+    with timed("imread"):
+        img = cv2.imread(image_path)
     if img is None:
         print(f"Error: Could not read image {image_path}")
+        instrumentation.increment("unreadable_images")
         return None
+    with timed("grayscale"):
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+# Optional decoded-crop store (see tensor_store.py); set with use_tensor_store
+_tensor_store = None
+
+def use_tensor_store(path):
+    """Read grayscale crops from the memory-mapped store at path (None to decode files again)"""
+    global _tensor_store
+    _tensor_store = TensorStore(path) if path else None
+    return _tensor_store
+
+# Image-quality columns written next to detected_blur / detected_angle
+QUALITY_COLUMNS = ['tenengrad', 'brightness', 'contrast', 'brightness_p5', 'brightness_p95',
+                   'overexposed_fraction', 'noise_sigma', 'text_density']
+# Pixels at or above this level count as over-exposed (glare)
+OVEREXPOSED_LEVEL = 250
+# Immerkær's noise estimation kernel: cancels image structure, keeps pixel noise
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+def compute_blur(gray):
+    """Variance of the Laplacian of an already decoded grayscale image"""
+    with timed("blur"):
+        return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+def compute_quality_metrics(gray):
+    """
+    OCR triage metrics of an already decoded grayscale image, all from the same buffer:
+      tenengrad            - mean squared Sobel gradient magnitude (sharpness)
+      brightness/contrast  - mean and standard deviation of the intensities
+      brightness_p5/p95    - 5th/95th intensity percentiles
+      overexposed_fraction - share of pixels at or above OVEREXPOSED_LEVEL (glare)
+      noise_sigma          - Immerkær fast noise estimate
+      text_density         - share of pixels that are dark strokes after adaptive thresholding
+    Brightness statistics come from a single 256-bin histogram rather than
+    separate passes over the pixels.
+    """
+    with timed("quality"):
+        height, width = gray.shape
+        pixels = gray.size
+
+        histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        levels = np.arange(256, dtype=np.float64)
+        brightness = histogram @ levels / pixels
+        contrast = np.sqrt(max(histogram @ (levels - brightness) ** 2 / pixels, 0.0))
+        cumulative = np.cumsum(histogram)
+        p5, p95 = np.searchsorted(cumulative, [0.05 * pixels, 0.95 * pixels])
+
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        tenengrad = float(cv2.mean(gx * gx + gy * gy)[0])
+
+        noise_sigma = 0.0
+        if height > 2 and width > 2:
+            residual = cv2.filter2D(gray, cv2.CV_32F, NOISE_KERNEL)[1:-1, 1:-1]
+            noise_sigma = float(np.abs(residual).sum(dtype=np.float64) * np.sqrt(np.pi / 2) / (6 * (width - 2) * (height - 2)))
+
+        strokes = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
 
-    # Compute variance of Laplacian
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    edge_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        return {
+            'tenengrad': tenengrad,
+            'brightness': float(brightness),
+            'contrast': float(contrast),
+            'brightness_p5': int(p5),
+            'brightness_p95': int(p95),
+            'overexposed_fraction': float(histogram[OVEREXPOSED_LEVEL:].sum() / pixels),
+            'noise_sigma': noise_sigma,
+            'text_density': cv2.countNonZero(strokes) / pixels,
+        }
 
-    return edge_var
+def detect_blur_level(image_path):
+    """
+    Detect blur level using only Laplacian variance.
+    Returns the blur score and a label ('blur' or 'clear').
+    """
+    gray = load_grayscale(image_path)
+    if gray is None:
+        return None
+
+    return compute_blur(gray)
     
 def get_line_angle(x1, y1, x2, y2):
     angle = degrees(atan2(y2 - y1, x2 - x1))
     return angle % 180  # keep within [0, 180)
 
-def detect_card_angle_fixed(image_path, output_dir=None):
+def line_angles(lines):
+    """Angles in [0, 180) of every HoughLinesP segment at once"""
+    segments = lines.reshape(-1, 4).astype(np.float64)
+    angles = np.degrees(np.arctan2(segments[:, 3] - segments[:, 1], segments[:, 2] - segments[:, 0]))
+    return angles % 180  # keep within [0, 180)
+
+def compute_card_angle(gray, analysis_width=None, source_width=None):
     """
-    Detect card angle using Hough Line Transform
+    Dominant line angle of an already decoded grayscale image,
+    using the Hough Line Transform. Returns None when no usable lines are
+    found, so a failed detection is not mistaken for a real 0° angle.
+    With analysis_width, wider images are downsampled to that width before edge
+    detection and the Hough parameters are scaled to match.
+    source_width is the original width when gray is an already resized copy
+    (e.g. from a resized tensor store); the Hough parameters are scaled for it too.
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"Error: Could not read image {image_path}")
-        return None
+    scale = gray.shape[1] / source_width if source_width else 1.0
+    if analysis_width and gray.shape[1] > analysis_width:
+        scale *= analysis_width / gray.shape[1]
+        height = max(1, round(gray.shape[0] * scale))
+        gray = cv2.resize(gray, (analysis_width, height), interpolation=cv2.INTER_AREA)
 
-    original_img = img.copy()
-    height, width = img.shape[:2]
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    edges = cv2.Canny(blurred, 50, 150)
+    with timed("canny"):
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        edges = cv2.Canny(blurred, 50, 150)
 
     # Probabilistic Hough Transform — gives endpoints
-    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=80, minLineLength=50, maxLineGap=10)
+    with timed("hough"):
+        lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=max(1, round(80 * scale)),
+                                minLineLength=max(1, round(50 * scale)), maxLineGap=max(1, round(10 * scale)))
 
     if lines is None or len(lines) == 0:
-        return 0
+        return None
 
-    # Calculate angles for each line
-    angles = []
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        angle = get_line_angle(x1, y1, x2, y2)
-        # Only consider angles in a valid range, e.g., ignore near-horizontal lines
-        if 10 < angle < 170:  # avoid noise
-            angles.append(angle)
+    # Calculate angles for all lines at once
+    angles = line_angles(lines)
+    # Only consider angles in a valid range, e.g., ignore near-horizontal lines
+    angles = angles[(angles > 10) & (angles < 170)]  # avoid noise
 
-    if not angles:
-        return 0
+    if angles.size == 0:
+        return None
 
     # Get the dominant rotation angle (most common bin)
     hist = np.histogram(angles, bins=180, range=(0, 180))
@@ -65,25 +158,150 @@ def detect_card_angle_fixed(image_path, output_dir=None):
 
     return dominant_angle
 
-def process_images_and_create_csv():
+def detect_card_angle_fixed(image_path, output_dir=None):
     """
-    Process all images in the address images folder and create CSV with results
+    Detect card angle using Hough Line Transform
     """
-    # Define the image directory path
-    image_dir = "address images"
-    
-    # Check if directory exists
-    if not os.path.exists(image_dir):
-        print(f"Error: Directory {image_dir} does not exist")
-        return
-    
+    gray = load_grayscale(image_path)
+    if gray is None:
+        return None
+
+    return compute_card_angle(gray)
+
+def analyze_image(image_path, analysis_width=None):
+    """
+    Check the image header, then decode it once and compute every metric from that buffer.
+    Returns a dict with detected_blur, detected_angle, the QUALITY_COLUMNS metrics
+    (see compute_quality_metrics) and status (see image_validation).
+    Files failing the header check are never decoded; they and undecodable files
+    get no metrics (None), and an image without usable lines gets no angle.
+    analysis_width enables the downscaled angle path (see compute_card_angle);
+    blur is always measured at full resolution.
+    With a tensor store in use (use_tensor_store) unchanged images are read
+    from it as zero-copy views instead of being decoded.
+    """
+    status = STATUS_OK
+    gray = None
+    source_width = None
+    if _tensor_store is not None:
+        with timed("store_read"):
+            gray = _tensor_store.load(image_path)
+        if gray is not None:
+            source_width = _tensor_store.source_width(image_path)
+    if gray is None:
+        with timed("probe"):
+            status = probe_image(image_path)['status']
+        if status == STATUS_OK:
+            gray = load_grayscale(image_path)
+            if gray is None:
+                status = "decode_failed"
+    if status != STATUS_OK:
+        instrumentation.increment(f"status.{status}")
+        return {'detected_blur': None, 'detected_angle': None, **dict.fromkeys(QUALITY_COLUMNS), 'status': status}
+
+    angle = compute_card_angle(gray, analysis_width, source_width)
+    return {
+        'detected_blur': compute_blur(gray),
+        'detected_angle': angle,
+        **compute_quality_metrics(gray),
+        'status': STATUS_OK if angle is not None else STATUS_ANGLE_NOT_FOUND,
+    }
+
+def _analyze_with_stats(image_path, analysis_width=None):
+    # Worker-side wrapper: timings recorded in a pool process are sent back
+    # with the result so the parent's report covers every image
+    return analyze_image(image_path, analysis_width), instrumentation.snapshot(reset_after=True)
+
+def _init_worker(tensor_store_path=None):
+    # Each worker is a separate process, so keep OpenCV from spawning
+    # its own thread pool on top of ours
+    cv2.setNumThreads(1)
+    # Forked workers inherit the parent's counters; start from zero so
+    # merging their snapshots does not count anything twice
+    instrumentation.reset()
+    # Map the store in this process rather than sharing the parent's mapping
+    use_tensor_store(tensor_store_path)
+
+def analyze_images(image_paths, workers=None, chunksize=None, analysis_width=None):
+    """
+    Analyze many images over a process pool.
+    Results are returned in the same order as image_paths.
+    workers=None uses every core, workers=1 runs in the current process.
+    """
+    image_paths = list(image_paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(image_paths) <= 1:
+        analyze = partial(analyze_image, analysis_width=analysis_width)
+        return [analyze(path) for path in tqdm(image_paths, desc="Processing images", unit="image")]
+
+    if chunksize is None:
+        # A few chunks per worker keeps the pool busy without paying
+        # the IPC cost once per image
+        chunksize = max(1, len(image_paths) // (workers * 4))
+
+    analyze = partial(_analyze_with_stats, analysis_width=analysis_width)
+    results = []
+    tensor_store_path = _tensor_store.path if _tensor_store is not None else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tensor_store_path,)) as executor:
+        for result, stats in tqdm(
+            executor.map(analyze, image_paths, chunksize=chunksize),
+            total=len(image_paths),
+            desc="Processing images",
+            unit="image"
+        ):
+            instrumentation.merge(stats)
+            results.append(result)
+    return results
+
+def list_images(image_dir="address images", manifest_path=None):
+    """
+    Return (image_names, image_paths) for the images to analyse.
+    With a manifest from extract_address_images the images are read in place
+    and named <upload_id>.png so they still match the NID data.
+    """
+    if manifest_path:
+        manifest = read_manifest(manifest_path)
+        upload_ids = sorted(manifest)
+        return [f"{upload_id}.png" for upload_id in upload_ids], [manifest[upload_id]['image_path'] for upload_id in upload_ids]
+
     # Get all image files
     image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']
     image_files = []
     
-    for file in os.listdir(image_dir):
+    for file in sorted(os.listdir(image_dir)):
         if any(file.lower().endswith(ext) for ext in image_extensions):
             image_files.append(file)
+
+    return image_files, [os.path.join(image_dir, image_file) for image_file in image_files]
+
+@instrumentation.instrumented_run("analysis")
+def process_images_and_create_csv(image_dir="address images", csv_path="image_analysis_results.csv", workers=None,
+                                  cache_path="image_analysis_cache.json", manifest_path=None, analysis_width=None,
+                                  quarantine_path="image_quarantine.csv", tensor_store_path=None, tensor_store_width=None):
+    """
+    Process all images in the address images folder and create CSV with results
+    Every row gets a status; unusable files (bad header, truncated, undecodable...)
+    are listed with their header details in quarantine_path.
+    Only new or changed images are analysed when a result cache is available;
+    pass cache_path=None to force a full pass.
+    Pass manifest_path to read the images listed by extract_address_images in place.
+    With tensor_store_path the crops are decoded once into that store (updated for
+    new or changed images, optionally resized to tensor_store_width) and analysed
+    from it, so repeated tuning runs skip PNG decoding. Angle detection on resized
+    crops scales its Hough parameters to the crop (see compute_card_angle).
+    analysis_width (e.g. 640) runs angle detection on a downsampled copy; see
+    benchmark_angle_drift.py for how far it drifts from full resolution.
+    Returns the results DataFrame (as written to csv_path), or None on error.
+    """
+    # Check if directory exists
+    source = manifest_path or image_dir
+    if not os.path.exists(source):
+        print(f"Error: {source} does not exist")
+        return
+    
+    image_files, image_paths = list_images(image_dir, manifest_path)
     
     if not image_files:
         print("No image files found in the directory")
@@ -91,34 +309,64 @@ def process_images_and_create_csv():
     
     print(f"Found {len(image_files)} images to process")
     
-    # Process each image with progress bar
-    results = []
-    
-    for image_file in tqdm(image_files, desc="Processing images", unit="image"):
-        image_path = os.path.join(image_dir, image_file)
-        
-        # Detect blur level
-        blur_score = detect_blur_level(image_path)
-
-        # Detect angle
-        detected_angle = detect_card_angle_fixed(image_path)
-
-        # Store results
-        results.append({
-            'image_name': image_file,
-            'detected_blur': blur_score,
-            'detected_angle': detected_angle
-        })
+    # Reuse cached results for unchanged images; entries for deleted images are dropped
+    # because the new store is rebuilt from the current file list only
+    params = {'analysis_width': analysis_width}
+    if tensor_store_path:
+        with timed("tensor_store_build"):
+            upload_ids = [os.path.splitext(image_file)[0] for image_file in image_files]
+            store = build_tensor_store(zip(upload_ids, image_paths), tensor_store_path, tensor_store_width)
+        use_tensor_store(tensor_store_path)
+        if store.width:
+            # Resized crops give different metrics from the files
+            params['tensor_store_width'] = store.width
+    cached_entries = load_cache(cache_path, params)
+    with timed("cache_lookup"):
+        fresh, stale = partition_cached(cached_entries, image_paths)
+    instrumentation.increment("images_cached", len(fresh))
+    instrumentation.increment("images_analysed", len(stale))
+    print(f"Cached: {len(fresh)}, to analyse: {len(stale)}, removed: {len(set(cached_entries) - set(image_paths))}")
+
+    # Analyze new/changed images across the process pool (order is preserved)
+    stale_paths = list(stale)
+    analysis = analyze_images(stale_paths, workers=workers, analysis_width=analysis_width) if stale_paths else []
+
+    entries = dict(fresh)
+    for path, metrics in zip(stale_paths, analysis):
+        entries[path] = make_entry(stale[path], metrics)
+
+    if cache_path:
+        save_cache(entries, cache_path, params)
+    use_tensor_store(None)
+
+    results = [
+        {'image_name': image_file, **entries[image_path]['result']}
+        for image_file, image_path in zip(image_files, image_paths)
+    ]
     
     # Create DataFrame and save to CSV
     df = pd.DataFrame(results)
-    csv_path = "image_analysis_results.csv"
-    df.to_csv(csv_path, index=False)
+    with timed("csv_write"):
+        df.to_csv(csv_path, index=False)
+
+    # Quarantine report: header details of every unusable file
+    bad = [
+        {'image_name': image_file, 'image_path': image_path, **probe_image(image_path), 'status': result['status']}
+        for image_file, image_path, result in zip(image_files, image_paths, results)
+        if result['status'] in FILE_ERROR_STATUSES
+    ]
+    if quarantine_path:
+        quarantine = pd.DataFrame(bad, columns=['image_name', 'image_path', 'status', 'format', 'width', 'height', 'size'])
+        quarantine.astype({'width': 'Int64', 'height': 'Int64'}).to_csv(quarantine_path, index=False)
     
     print(f"\nProcessing complete! Results saved to: {csv_path}")
     print(f"Total images processed: {len(results)}")
+    print(f"Status counts: {df['status'].value_counts().to_dict()}")
+    if bad and quarantine_path:
+        print(f"Quarantined: {len(bad)} unusable images, see {quarantine_path}")
     print("\nFirst few results:")
     print(df.head())
+    return df
 
 if __name__ == "__main__":
-    process_images_and_create_csv()
\ No newline at end of file
+    process_images_and_create_csv()
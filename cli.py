@@ -0,0 +1,173 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Light module (stdlib only); the heavy stage modules (cv2, pandas) are imported
+# inside the commands that need them
+from extract_address_img import EXTRACT_MODES
+
+# Options shared between subcommands: name -> (flags, argparse keyword arguments).
+# run combines the options of every stage, so each name means the same thing everywhere.
+OPTIONS = {
+    'uploads_dir': (["--uploads-dir"], dict(default="uploads")),
+    'mode': (["--mode"], dict(choices=EXTRACT_MODES, default="copy", help="how extract indexes the crops")),
+    'image_dir': (["--image-dir"], dict(default="address images", help="folder of address crops")),
+    'manifest': (["--manifest"], dict(default=None, help="upload_id -> image_path manifest (extract writes "
+                                                         "address_images_manifest.csv by default)")),
+    'workers': (["--workers"], dict(type=int, default=None)),
+    'tensor_store': (["--tensor-store"], dict(default=None, help="memory-mapped crop store (see tensor_store.py)")),
+    'tensor_store_width': (["--tensor-store-width"], dict(type=int, default=None)),
+    'analysis': (["--analysis"], dict(default="image_analysis_results.csv", help="image analysis results CSV")),
+    'cache': (["--cache"], dict(default="image_analysis_cache.json")),
+    'no_cache': (["--no-cache"], dict(action="store_true", help="redo every image instead of using the cache")),
+    'analysis_width': (["--analysis-width"], dict(type=int, default=None)),
+    'quarantine': (["--quarantine"], dict(default="image_quarantine.csv")),
+    'deskew_dir': (["--deskew-dir"], dict(default="deskewed images", help="skew-corrected crops")),
+    'deskew_results': (["--deskew-results"], dict(default="deskew_results.csv",
+                                                  help="skew angles; merged into the data when present")),
+    'csv': (["--csv"], dict(default="nid_infos_compared_31-07-25_12-14.csv", help="NID comparison data")),
+    'output': (["--output"], dict(default="filtered_nid_data_with_images.parquet",
+                                  help="merged data; the suffix (.csv, .parquet, .arrow) selects the format")),
+    'fields': (["--fields"], dict(nargs="+", default=["address"])),
+    'versions': (["--versions"], dict(nargs="+", default=["v6"], help="OCR versions, or 'all'")),
+    'aggregates': (["--aggregates"], dict(default=None, help="analytics aggregates file")),
+    'no_aggregates': (["--no-aggregates"], dict(action="store_true")),
+    'original_blur_angle': (["--original-blur-angle"], dict(action="store_true",
+                                                            help="keep blur/angle from --csv instead of the analysis")),
+    'data': (["--data"], dict(default=None, help="data file for the viewer (default: newest merged file)")),
+    'port': (["--port"], dict(type=int, default=None)),
+    'headless': (["--headless"], dict(action="store_true", help="do not open a browser")),
+}
+
+EXTRACT_OPTIONS = ['uploads_dir', 'mode', 'image_dir', 'manifest', 'workers', 'tensor_store']
+ANALYSE_OPTIONS = ['image_dir', 'manifest', 'workers', 'tensor_store', 'tensor_store_width', 'analysis', 'cache',
+                   'no_cache', 'analysis_width', 'quarantine']
+DESKEW_OPTIONS = ['image_dir', 'manifest', 'workers', 'deskew_dir', 'deskew_results', 'no_cache']
+MERGE_OPTIONS = ['csv', 'analysis', 'manifest', 'output', 'fields', 'versions', 'aggregates', 'no_aggregates',
+                 'original_blur_angle', 'deskew_results']
+SERVE_OPTIONS = ['data', 'tensor_store', 'aggregates', 'port', 'headless']
+
+def _add_options(parser, names):
+    for name in names:
+        flags, kwargs = OPTIONS[name]
+        parser.add_argument(*flags, dest=name, **kwargs)
+
+def extract(args):
+    """Returns the number of crops indexed, or None on error"""
+    from extract_address_img import extract_address_images
+
+    return extract_address_images(args.mode, args.uploads_dir, args.image_dir, args.manifest or "address_images_manifest.csv",
+                           workers=args.workers or 16, tensor_store_path=args.tensor_store)
+
+def analyse(args):
+    """Returns the analysis results DataFrame, for merge to reuse without reading the CSV"""
+    from check import process_images_and_create_csv
+
+    return process_images_and_create_csv(args.image_dir, args.analysis, workers=args.workers,
+                                         cache_path=None if args.no_cache else args.cache,
+                                         manifest_path=args.manifest, analysis_width=args.analysis_width,
+                                         quarantine_path=args.quarantine, tensor_store_path=args.tensor_store,
+                                         tensor_store_width=args.tensor_store_width)
+
+def deskew(args):
+    from deskew import deskew_and_create_csv
+
+    return deskew_and_create_csv(args.image_dir, args.deskew_dir, args.deskew_results, args.workers,
+                                 cache_path=None if args.no_cache else "deskew_cache.json",
+                                 manifest_path=args.manifest)
+
+def merge(args, image_analysis_df=None):
+    from create_filtered_csv import create_filtered_csv
+
+    kwargs = {}
+    if args.no_aggregates:
+        kwargs['aggregates_path'] = None
+    elif args.aggregates:
+        kwargs['aggregates_path'] = args.aggregates
+    return create_filtered_csv(args.original_blur_angle, args.manifest, args.csv, args.analysis, args.output,
+                               fields=tuple(args.fields),
+                               versions=None if args.versions == ["all"] else tuple(args.versions),
+                               image_analysis_df=image_analysis_df, deskew_file=args.deskew_results, **kwargs)
+
+def serve(args):
+    """Run the Streamlit viewer in its own process (Streamlit needs a fresh script runner)"""
+    env = dict(os.environ)
+    if args.data:
+        env["NID_DATA_FILE"] = args.data
+    if args.tensor_store:
+        env["NID_TENSOR_STORE"] = args.tensor_store
+    if args.aggregates:
+        env["NID_AGGREGATES"] = args.aggregates
+    command = [sys.executable, "-m", "streamlit", "run", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                      "streamlit_app.py")]
+    if args.port:
+        command += ["--server.port", str(args.port)]
+    if args.headless:
+        command += ["--server.headless", "true"]
+    print("Launching Streamlit app...")
+    return subprocess.call(command, env=env)
+
+def run(args):
+    """
+    The whole pipeline in one process: optionally extract, then analyse,
+    optionally deskew, and merge (the analysis results are handed over in
+    memory), then serve unless --no-serve. Returns a non-zero exit code if a stage produced nothing.
+    """
+    if args.extract:
+        if extract(args) is None:
+            return 1
+        # Every extract mode writes the manifest; analyse and merge read the crops through it
+        args.manifest = args.manifest or "address_images_manifest.csv"
+    image_analysis_df = None
+    if not args.original_blur_angle:
+        image_analysis_df = analyse(args)
+        if image_analysis_df is None:
+            return 1
+    if args.deskew and deskew(args) is None:
+        return 1
+    if merge(args, image_analysis_df) is None:
+        return 1
+    if args.no_serve:
+        return 0
+    # The viewer shows exactly what was just merged
+    args.data = args.data or args.output
+    return serve(args)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="NID image processing: extract, analyse, merge and serve")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    commands = [
+        ("extract", extract, EXTRACT_OPTIONS, "collect the address crops from the upload folders"),
+        ("analyse", analyse, ANALYSE_OPTIONS, "blur, angle and quality metrics of every crop"),
+        ("deskew", deskew, DESKEW_OPTIONS, "write skew-corrected copies of the crops"),
+        ("merge", merge, MERGE_OPTIONS, "join the analysis with the NID data for the viewer"),
+        ("serve", serve, SERVE_OPTIONS, "launch the Streamlit viewer"),
+    ]
+    for name, function, names, help_text in commands:
+        subparser = subparsers.add_parser(name, help=help_text)
+        _add_options(subparser, names)
+        subparser.set_defaults(function=function)
+
+    run_parser = subparsers.add_parser("run", help="analyse, merge and serve in one process")
+    _add_options(run_parser, list(dict.fromkeys(EXTRACT_OPTIONS + ANALYSE_OPTIONS + DESKEW_OPTIONS + MERGE_OPTIONS + SERVE_OPTIONS)))
+    run_parser.add_argument("--extract", action="store_true", help="extract the crops from --uploads-dir first")
+    run_parser.add_argument("--deskew", action="store_true", help="write skew-corrected crops before merging")
+    run_parser.add_argument("--no-serve", action="store_true", help="stop after merging (e.g. from cron)")
+    run_parser.set_defaults(function=run)
+    return parser
+
+def main(argv=None):
+    """
+    Entry point; returns the process exit code. The stages return None after
+    printing an error; serve and run return an exit code of their own.
+    """
+    args = build_parser().parse_args(argv)
+    result = args.function(args)
+    if result is None:
+        return 1
+    return result if args.function in (serve, run) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,14 @@
 import pandas as pd
 import os
+import numpy as np
 from pathlib import Path
+from extract_address_img import read_manifest
+from image_validation import FILE_ERROR_STATUSES
+from analytics import AGGREGATES_PATH, update_aggregates
+from nid_storage import read_table, table_columns, write_table
+from ocr_accuracy import ocr_columns
+import instrumentation
+from instrumentation import timed
 
 def create_filtered_csv():
     """
@@ -17,7 +25,7 @@ def create_filtered_csv():
     image_analysis_df = pd.read_csv(image_analysis_file)
     
     # Remove .png extension from image_name for matching
-    image_analysis_df['upload_id_match'] = image_analysis_df['image_name'].str.replace('.png', '')
+    image_analysis_df['upload_id_match'] = image_analysis_df['image_name'].str.removesuffix('.png')
     
     # Select only the required columns from original CSV (excluding blur and angle)
     required_columns = ['id', 'upload_id', 'address_ocr_v6_accuracy', 'address_ocr_v6']
@@ -40,69 +48,131 @@ def create_filtered_csv():
     column_order = ['id', 'upload_id', 'detected_blur', 'detected_angle', 'address_ocr_v6_accuracy', 'address_ocr_v6']
     filtered_df = merged_df[column_order].copy()
     
-def create_filtered_csv(use_original_blur_angle=False):
+def list_image_ids(folder, suffix=".png"):
+    """upload_ids of the images in folder, from a single directory scan"""
+    try:
+        with os.scandir(folder) as entries:
+            return [entry.name[:-len(suffix)] for entry in entries if entry.name.endswith(suffix)]
+    except FileNotFoundError:
+        return []
+
+def resolve_image_paths(upload_ids, folder, suffix=".png"):
+    """
+    Image path for every upload_id, or "" when the folder has no image for it.
+    Paths are built and matched column-wise instead of one stat per row.
+    """
+    folder = str(Path(folder))
+    upload_ids = upload_ids.astype("string")
+    has_image = upload_ids.isin(list_image_ids(folder, suffix)).to_numpy(dtype=bool, na_value=False)
+    paths = (folder + os.sep + upload_ids + suffix).to_numpy(dtype=object, na_value="")
+    return np.where(has_image, paths, "")
+
+@instrumentation.instrumented_run("merge")
+def create_filtered_csv(use_original_blur_angle=False, manifest_path=None,
+                        csv_file="nid_infos_compared_31-07-25_12-14.csv",
+                        image_analysis_file="image_analysis_results.csv",
+                        output_file="filtered_nid_data_with_images.csv",
+                        fields=("address",), versions=("v6",), aggregates_path=AGGREGATES_PATH,
+                        image_analysis_df=None, deskew_file="deskew_results.csv"):
     """
     Create a new CSV with only specified columns and add image paths
-    Use blur and angle values from image_analysis_results.csv (default)
+    Use blur, angle and image-quality values from image_analysis_results.csv (default)
     Or, if use_original_blur_angle=True, keep detected_blur and detected_angle from original csv_file.
+    If manifest_path is given, image paths come from the extract_address_images manifest
+    so the images are referenced where they are instead of from 'address images'.
+    Input and output files may be CSV, Parquet or Arrow IPC (chosen by suffix);
+    only the needed columns are read from the original data.
+    fields and versions select the <field>_ocr_<version> text and accuracy columns
+    to keep side by side; versions=None keeps every version found in csv_file.
+    Images with a file-error status in the analysis results (see image_validation)
+    get no image_path, so quarantined files never reach the viewer.
+    The vendor column is kept when present, and the analytics aggregates of this
+    batch (named after csv_file) are refreshed in aggregates_path; other batches
+    there are kept as they are.
+    image_analysis_df, e.g. as returned by check.process_images_and_create_csv,
+    is used instead of reading image_analysis_file again. Returns the merged DataFrame.
+    If deskew_file (from deskew.py) exists, its skew_angle and deskewed_path are
+    added, so the viewer can show the corrected crops.
     """
-    # Read the original CSV
-    csv_file = "nid_infos_compared_31-07-25_12-14.csv"
-    df = pd.read_csv(csv_file)
-
-    required_columns = ['id', 'upload_id', 'address_ocr_v6_accuracy', 'address_ocr_v6']
+    available = table_columns(csv_file)
+    ocr = ocr_columns(fields, versions, available)
+    if not ocr:
+        print(f"Error: No OCR columns for fields {', '.join(fields)} found in {csv_file}")
+        return
+    id_columns = ['id', 'upload_id'] + (['vendor'] if 'vendor' in available else [])
+    required_columns = id_columns + ocr
+    column_order = id_columns + ['detected_blur', 'detected_angle'] + ocr
+    quarantined = []
 
     if use_original_blur_angle:
         # If original CSV has detected_blur and detected_angle, keep them
-        if 'detected_blur' in df.columns and 'detected_angle' in df.columns:
-            filtered_df = df[required_columns + ['detected_blur', 'detected_angle']].copy()
+        if {'detected_blur', 'detected_angle'} <= set(available):
+            with timed("csv_read"):
+                filtered_df = read_table(csv_file, columns=required_columns + ['detected_blur', 'detected_angle'])
             # Reorder columns
-            column_order = ['id', 'upload_id', 'detected_blur', 'detected_angle', 'address_ocr_v6_accuracy', 'address_ocr_v6']
             filtered_df = filtered_df[column_order].copy()
         else:
             print("Original CSV does not contain 'detected_blur' and 'detected_angle'.")
             return
     else:
-        # Read the image analysis results CSV
-        image_analysis_file = "image_analysis_results.csv"
-        image_analysis_df = pd.read_csv(image_analysis_file)
+        # Read the image analysis results, unless the analysis stage handed them over
+        if image_analysis_df is None:
+            with timed("csv_read"):
+                image_analysis_df = read_table(image_analysis_file)
+        else:
+            image_analysis_df = image_analysis_df.copy()
         # Remove .png extension from image_name for matching
-        image_analysis_df['upload_id_match'] = image_analysis_df['image_name'].str.replace('.png', '')
-        # Filter the dataframe to keep only required columns
-        filtered_df = df[required_columns].copy()
+        image_analysis_df['upload_id_match'] = image_analysis_df['image_name'].str.removesuffix('.png')
+        if 'status' in image_analysis_df.columns:
+            bad = image_analysis_df['status'].isin(FILE_ERROR_STATUSES)
+            quarantined = image_analysis_df.loc[bad, 'upload_id_match'].tolist()
+        # detected_blur, detected_angle and any further quality metrics (see check.QUALITY_COLUMNS)
+        metric_columns = [c for c in image_analysis_df.columns if c not in ('image_name', 'upload_id_match', 'status')]
+        # Read only the required columns of the original data
+        with timed("csv_read"):
+            filtered_df = read_table(csv_file, columns=required_columns)
         # Merge with image analysis data to get blur and angle values
-        merged_df = filtered_df.merge(
-            image_analysis_df[['upload_id_match', 'detected_blur', 'detected_angle']],
-            left_on='upload_id',
-            right_on='upload_id_match',
-            how='left'
-        )
+        with timed("merge"):
+            merged_df = filtered_df.merge(
+                image_analysis_df[['upload_id_match'] + metric_columns],
+                left_on='upload_id',
+                right_on='upload_id_match',
+                how='left'
+            )
         # Drop the temporary matching column
         merged_df = merged_df.drop('upload_id_match', axis=1)
-        # Reorder columns to match the original order
-        column_order = ['id', 'upload_id', 'detected_blur', 'detected_angle', 'address_ocr_v6_accuracy', 'address_ocr_v6']
+        # Reorder columns to match the original order, quality metrics after blur/angle
+        column_order = id_columns + metric_columns + ocr
         filtered_df = merged_df[column_order].copy()
 
-    # Define the address images folder
-    address_images_folder = Path("address images")
-
-    # Add image_path column
-    def get_image_path(upload_id):
-        """Get the image path for a given upload_id"""
-        if pd.isna(upload_id):
-            return ""
-        image_file = address_images_folder / f"{upload_id}.png"
-        if image_file.exists():
-            return str(image_file)
+    with timed("path_resolution"):
+        if manifest_path:
+            # Paths in the manifest were stat'ed when it was written
+            manifest = read_manifest(manifest_path)
+            image_paths = pd.Series({upload_id: row['image_path'] for upload_id, row in manifest.items()}, dtype=object)
+            filtered_df['image_path'] = filtered_df['upload_id'].map(image_paths).fillna("")
         else:
-            return ""
+            # One directory scan, then a vectorised join against upload_id
+            filtered_df['image_path'] = resolve_image_paths(filtered_df['upload_id'], "address images")
+        # Keep unusable images out of the merged data
+        filtered_df.loc[filtered_df['upload_id'].isin(quarantined), 'image_path'] = ""
+
+    if deskew_file and os.path.exists(deskew_file):
+        with timed("csv_read"):
+            deskew_df = read_table(deskew_file, columns=['image_name', 'skew_angle', 'deskewed_path'])
+        deskew_df.index = deskew_df['image_name'].str.removesuffix('.png')
+        filtered_df['skew_angle'] = filtered_df['upload_id'].map(deskew_df['skew_angle'])
+        deskewed_paths = filtered_df['upload_id'].map(deskew_df['deskewed_path']).fillna("")
+        filtered_df['deskewed_path'] = deskewed_paths.where(filtered_df['image_path'] != "", "")
 
-    # Apply the function to create the image_path column
-    filtered_df['image_path'] = filtered_df['upload_id'].apply(get_image_path)
+    # Save the new file (format follows the suffix of output_file)
+    with timed("write"):
+        write_table(filtered_df, output_file)
 
-    # Save the new CSV
-    output_file = "filtered_nid_data_with_images.csv"
-    filtered_df.to_csv(output_file, index=False)
+    # Pre-aggregated statistics for the viewer's analytics mode
+    if aggregates_path:
+        with timed("aggregates"):
+            update_aggregates(filtered_df, Path(csv_file).stem, csv_file, aggregates_path)
 
     # Print summary
     total_rows = len(filtered_df)
@@ -113,17 +183,22 @@ def create_filtered_csv(use_original_blur_angle=False):
     print(f"--- CSV Processing Complete ---")
     print(f"Original CSV: {csv_file}")
     if not use_original_blur_angle:
-        print(f"Image Analysis CSV: image_analysis_results.csv")
+        print(f"Image Analysis CSV: {image_analysis_file}")
     print(f"New CSV: {output_file}")
+    if aggregates_path:
+        print(f"Aggregates: {aggregates_path}")
     print(f"Total rows: {total_rows}")
     print(f"Rows with images: {rows_with_images}")
     print(f"Rows without images: {rows_without_images}")
     print(f"Rows with blur/angle data: {rows_with_blur_angle}")
-    print(f"Columns included: {', '.join(column_order + ['image_path'])}")
+    if quarantined:
+        print(f"Quarantined images left out: {len(quarantined)}")
+    print(f"Columns included: {', '.join(filtered_df.columns)}")
 
     # Show first few rows
     print(f"\nFirst 5 rows of the new CSV:")
     print(filtered_df.head().to_string(index=False))
+    return filtered_df
 
 if __name__ == "__main__":
     # Default: use merged blur/angle
@@ -0,0 +1,271 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+import instrumentation
+from instrumentation import timed
+from analysis_cache import load_cache, save_cache, partition_cached, make_entry
+from check import list_images
+from extract_address_img import MANIFEST_COLUMNS
+from image_validation import probe_image, STATUS_OK, STATUS_ANGLE_NOT_FOUND
+
+DESKEW_DIR = "deskewed images"
+DESKEW_RESULTS = "deskew_results.csv"
+# Bump whenever the estimate or the warp changes, so cached crops are redone
+DESKEW_VERSION = 1
+# Text baselines of a crop are within this many degrees of horizontal
+MAX_SKEW = 15.0
+# Projection-profile search: coarse pass when Hough finds nothing, then a fine
+# pass around the estimate
+COARSE_RANGE, COARSE_STEP = 5.0, 0.5
+REFINE_RANGE, REFINE_STEP = 1.0, 0.05
+# Smaller skews are left alone; the original crop is used as is
+MIN_CORRECTION = 0.1
+# Skew is scale invariant, so it is estimated on a copy at most this wide
+ESTIMATE_WIDTH = 800
+
+def _hough_skew(gray):
+    """
+    Length-weighted median angle of the near-horizontal Hough segments, in
+    degrees (positive = text slopes down to the right), or None without any.
+    Unlike compute_card_angle, the near-horizontal lines are the ones kept.
+    """
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    # Quarter-degree angular resolution
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 720, threshold=80, minLineLength=50, maxLineGap=10)
+    if lines is None:
+        return None
+    segments = lines.reshape(-1, 4).astype(np.float64)
+    dx = segments[:, 2] - segments[:, 0]
+    dy = segments[:, 3] - segments[:, 1]
+    angles = (np.degrees(np.arctan2(dy, dx)) + 90) % 180 - 90  # fold into [-90, 90)
+    lengths = np.hypot(dx, dy)
+    keep = np.abs(angles) <= MAX_SKEW
+    if not keep.any():
+        return None
+    order = np.argsort(angles[keep])
+    cumulative = np.cumsum(lengths[keep][order])
+    return float(angles[keep][order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+def _foreground(gray):
+    """(x, y) of the ink pixels: the smaller Otsu class, as text is the minority"""
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    ys, xs = np.nonzero(binary)
+    return xs.astype(np.float64), ys.astype(np.float64)
+
+def _profile_search(xs, ys, center, half_range, step):
+    """
+    Rotation (degrees) in center ± half_range that makes the row histogram of
+    the ink sharpest, i.e. the text lines horizontal. Rows are taken along the
+    rotated y axis, -sin(a) x + cos(a) y, as cv2.getRotationMatrix2D rotates.
+    The best step is refined by fitting a parabola through its neighbours.
+    """
+    candidates = center + np.arange(-half_range, half_range + step / 2, step)
+    offset = np.hypot(xs.max(), ys.max()) + 1
+    scores = np.empty(len(candidates))
+    for i, angle in enumerate(np.radians(candidates)):
+        rows = np.rint(ys * np.cos(angle) - xs * np.sin(angle) + offset).astype(np.int64)
+        counts = np.bincount(rows)
+        scores[i] = np.dot(counts, counts)
+    best = int(np.argmax(scores))
+    if 0 < best < len(candidates) - 1:
+        left, middle, right = scores[best - 1:best + 2]
+        curvature = left - 2 * middle + right
+        if curvature < 0:
+            return float(candidates[best] + step * 0.5 * (left - right) / curvature)
+    return float(candidates[best])
+
+def estimate_skew(gray):
+    """
+    Skew of a grayscale crop in degrees, to sub-degree precision, or None if it
+    has no ink. The Hough estimate of the near-horizontal lines is refined with a
+    projection profile; rotating by the result (see deskew) levels the text.
+    """
+    if gray.shape[1] > ESTIMATE_WIDTH:
+        height = max(1, round(gray.shape[0] * ESTIMATE_WIDTH / gray.shape[1]))
+        gray = cv2.resize(gray, (ESTIMATE_WIDTH, height), interpolation=cv2.INTER_AREA)
+    with timed("skew_hough"):
+        center = _hough_skew(gray)
+    xs, ys = _foreground(gray)
+    if xs.size == 0:
+        return center
+    with timed("skew_profile"):
+        if center is None:
+            center = _profile_search(xs, ys, 0.0, COARSE_RANGE, COARSE_STEP)
+        return _profile_search(xs, ys, center, REFINE_RANGE, REFINE_STEP)
+
+def deskew(image, angle):
+    """
+    image rotated by angle degrees about its centre, on a canvas grown to keep
+    the corners. Borders repeat the edge pixels so no dark wedges reach OCR.
+    """
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(round(height * sin + width * cos))
+    new_height = int(round(height * cos + width * sin))
+    matrix[0, 2] += (new_width - width) / 2
+    matrix[1, 2] += (new_height - height) / 2
+    return cv2.warpAffine(image, matrix, (new_width, new_height), flags=cv2.INTER_CUBIC,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+def deskew_image(image_path, output_path):
+    """
+    Estimate the skew of one crop and, if above MIN_CORRECTION, write the
+    corrected crop to output_path. Returns skew_angle, deskewed_path ("" when
+    the original is used as is) and status (see image_validation).
+    """
+    status = probe_image(image_path)['status']
+    if status != STATUS_OK:
+        return {'skew_angle': None, 'deskewed_path': "", 'status': status}
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return {'skew_angle': None, 'deskewed_path': "", 'status': "decode_failed"}
+    angle = estimate_skew(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    if angle is None:
+        return {'skew_angle': None, 'deskewed_path': "", 'status': STATUS_ANGLE_NOT_FOUND}
+    if abs(angle) < MIN_CORRECTION:
+        return {'skew_angle': angle, 'deskewed_path': "", 'status': STATUS_OK}
+    with timed("warp"):
+        corrected = deskew(image, angle)
+    # imwrite picks the format from the suffix, so keep .png on the temporary file
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.png"
+    cv2.imwrite(tmp_path, corrected)
+    os.replace(tmp_path, output_path)
+    return {'skew_angle': angle, 'deskewed_path': output_path, 'status': STATUS_OK}
+
+def _deskew_with_stats(item):
+    image_path, output_path = item
+    return deskew_image(image_path, output_path), instrumentation.snapshot(reset_after=True)
+
+def _init_worker():
+    # One OpenCV thread per process, and counters from zero (see check._init_worker)
+    cv2.setNumThreads(1)
+    instrumentation.reset()
+
+def deskew_images(items, workers=None, chunksize=None):
+    """
+    Deskew (image_path, output_path) pairs over a process pool; results in order.
+    Each worker reads, warps and writes its own crops, so only the small result
+    dicts cross process boundaries. workers=1 runs in the current process.
+    """
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(items) <= 1:
+        return [deskew_image(*item) for item in tqdm(items, desc="Deskewing images", unit="image")]
+    if chunksize is None:
+        chunksize = max(1, len(items) // (workers * 4))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for result, stats in tqdm(executor.map(_deskew_with_stats, items, chunksize=chunksize),
+                                  total=len(items), desc="Deskewing images", unit="image"):
+            instrumentation.merge(stats)
+            results.append(result)
+    return results
+
+@instrumentation.instrumented_run("deskew")
+def deskew_and_create_csv(image_dir="address images", output_dir=DESKEW_DIR, csv_path=DESKEW_RESULTS,
+                          workers=None, cache_path="deskew_cache.json", manifest_path=None,
+                          output_manifest_path="deskew_manifest.csv"):
+    """
+    Write skew-corrected copies of the crops to output_dir and their skew_angle
+    and deskewed_path to csv_path (image_name as in image_analysis_results.csv,
+    so create_filtered_csv can merge them).
+    Reruns only redo crops whose source changed or whose corrected copy is gone;
+    pass cache_path=None to redo every crop. output_manifest_path lists, in the
+    extract_address_images manifest format, the corrected crop of every upload
+    (or the original where none was needed), ready for an OCR re-run.
+    Returns the results DataFrame, or None on error.
+    """
+    source = manifest_path or image_dir
+    if not os.path.exists(source):
+        print(f"Error: {source} does not exist")
+        return
+    image_files, image_paths = list_images(image_dir, manifest_path)
+    if not image_files:
+        print("No image files found in the directory")
+        return
+    # Corrected copies are named like the crops, so they must not share a folder
+    output_root = os.path.abspath(output_dir)
+    if any(os.path.dirname(os.path.abspath(path)) == output_root for path in image_paths):
+        print(f"Error: {output_dir} holds the crops being deskewed; choose another output_dir")
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    output_paths = dict(zip(image_paths, (os.path.join(output_dir, image_file) for image_file in image_files)))
+
+    params = {'deskew_version': DESKEW_VERSION, 'output_dir': output_dir}
+    cached_entries = load_cache(cache_path, params)
+    with timed("cache_lookup"):
+        fresh, stale = partition_cached(cached_entries, image_paths)
+    # A cached result is only usable while its corrected copy is still on disk
+    for path, entry in list(fresh.items()):
+        deskewed_path = entry['result']['deskewed_path']
+        if deskewed_path and not os.path.exists(deskewed_path):
+            del fresh[path]
+            stale[path] = (entry['size'], entry['mtime_ns'], entry['hash'])
+    instrumentation.increment("images_cached", len(fresh))
+    instrumentation.increment("images_deskewed", len(stale))
+    print(f"Found {len(image_files)} images, cached: {len(fresh)}, to deskew: {len(stale)}")
+
+    stale_paths = list(stale)
+    results = deskew_images(((path, output_paths[path]) for path in stale_paths), workers=workers)
+    entries = dict(fresh)
+    for path, result in zip(stale_paths, results):
+        entries[path] = make_entry(stale[path], result)
+    if cache_path:
+        save_cache(entries, cache_path, params)
+
+    # Corrected copies this stage wrote earlier for images that are gone or no
+    # longer need correcting; nothing else in output_dir is touched
+    live = {entry['result']['deskewed_path'] for entry in entries.values()}
+    for entry in cached_entries.values():
+        path = entry['result']['deskewed_path']
+        if path and path not in live and os.path.exists(path):
+            os.remove(path)
+
+    df = pd.DataFrame([
+        {'image_name': image_file, **entries[image_path]['result']}
+        for image_file, image_path in zip(image_files, image_paths)
+    ])
+    with timed("csv_write"):
+        df.to_csv(csv_path, index=False)
+    if output_manifest_path:
+        # Unusable files stay out, as in the merged data
+        usable = df['status'].isin([STATUS_OK, STATUS_ANGLE_NOT_FOUND])
+        manifest = pd.DataFrame({
+            'upload_id': df['image_name'].str.removesuffix('.png'),
+            'image_path': df['deskewed_path'].where(df['deskewed_path'] != "", pd.Series(image_paths)),
+        })[usable]
+        stats = [os.stat(path) for path in manifest['image_path']]
+        manifest['size'] = [stat.st_size for stat in stats]
+        manifest['mtime_ns'] = [stat.st_mtime_ns for stat in stats]
+        manifest[MANIFEST_COLUMNS].to_csv(output_manifest_path, index=False)
+
+    corrected = int((df['deskewed_path'] != "").sum())
+    print(f"\nDeskew complete! Results saved to: {csv_path}")
+    print(f"Corrected: {corrected}, already straight: {int((df['status'] == STATUS_OK).sum()) - corrected}, "
+          f"no estimate: {int((df['status'] != STATUS_OK).sum())}")
+    print(f"Skew (degrees): median {df['skew_angle'].abs().median():.2f}, max {df['skew_angle'].abs().max():.2f}")
+    if output_manifest_path:
+        print(f"Manifest of corrected crops: {output_manifest_path}")
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the skew of the address crops and write corrected copies")
+    parser.add_argument("--image-dir", default="address images")
+    parser.add_argument("--manifest", default=None)
+    parser.add_argument("--output-dir", default=DESKEW_DIR)
+    parser.add_argument("--results", default=DESKEW_RESULTS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    deskew_and_create_csv(args.image_dir, args.output_dir, args.results, args.workers,
+                          None if args.no_cache else "deskew_cache.json", args.manifest)
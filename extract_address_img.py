@@ -1,56 +1,169 @@
+import csv
 import os
 import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def extract_address_images():
+EXTRACT_MODES = ("copy", "hardlink", "symlink", "manifest")
+MANIFEST_COLUMNS = ["upload_id", "image_path", "size", "mtime_ns"]
+
+def _find_target(folder_path, image_name="address_first_cropped_img.png"):
+    """Stat the address crop of one upload folder; returns (folder name, path, stat or None)"""
+    target = os.path.join(folder_path, image_name)
+    try:
+        return os.path.basename(folder_path), target, os.stat(target)
+    except FileNotFoundError:
+        return os.path.basename(folder_path), target, None
+
+def scan_uploads(uploads_dir, workers=16):
+    """
+    List upload folders with os.scandir and stat their address crops in parallel.
+    Stats are I/O-bound (especially on network storage), so threads are enough.
+    """
+    with os.scandir(uploads_dir) as entries:
+        folders = sorted(entry.path for entry in entries if entry.is_dir())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_find_target, folders))
+
+def read_manifest(manifest_path="address_images_manifest.csv"):
+    """Read a manifest written by extract_address_images into {upload_id: row}"""
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        return {row["upload_id"]: row for row in csv.DictReader(f)}
+
+def _is_unchanged(mode, source, destination, source_stat):
+    """
+    Whether destination already reflects source, so the entry can be skipped.
+    Entries left by another mode (e.g. a symlink when copying) count as changed.
+    """
+    if not os.path.lexists(destination):
+        return False
+    if mode == "symlink":
+        return os.path.islink(destination) and os.readlink(destination) == os.path.abspath(source)
+    # lstat, so a symlink is judged as itself rather than as the file it points to
+    dest_stat = os.lstat(destination)
+    if stat.S_ISLNK(dest_stat.st_mode):
+        return False
+    if mode == "hardlink":
+        return os.path.samestat(source_stat, dest_stat)
+    if os.path.samestat(source_stat, dest_stat):
+        # A hard link, not a copy of its own
+        return False
+    # copy2 preserves mtime, so size + mtime identify an up-to-date copy
+    return dest_stat.st_size == source_stat.st_size and dest_stat.st_mtime_ns == source_stat.st_mtime_ns
+
+def extract_address_images(mode="copy", uploads_dir="uploads", output_dir="address images",
+                           manifest_path="address_images_manifest.csv", workers=16, tensor_store_path=None):
     """
     Extract address_first_cropped_img.png files from folders inside uploads
     and save them in a root directory folder called 'address images'
+
+    mode controls how the index is built:
+      copy     - duplicate each image (original behaviour)
+      hardlink - hard link each image, no extra disk space
+      symlink  - symbolic link to each image
+      manifest - write no files, only a manifest pointing at the images in place
+    Every mode writes manifest_path (upload_id -> image_path to read), and
+    entries that are already up to date are skipped on rerun.
+    With tensor_store_path the crops are also decoded once into a memory-mapped
+    grayscale store (see tensor_store.py) for check.py and the thumbnails.
+    Returns the number of crops in the manifest, or None on error.
     """
-    
+    if mode not in EXTRACT_MODES:
+        print(f"Error: Unknown mode {mode!r}, expected one of {', '.join(EXTRACT_MODES)}")
+        return
+
     # Define paths
-    uploads_dir = Path("uploads")
-    output_dir = Path("address images")
-    
-    # Create output directory if it doesn't exist
-    output_dir.mkdir(exist_ok=True)
-    
+    uploads_dir = Path(uploads_dir)
+    output_dir = Path(output_dir)
+
     # Check if uploads directory exists
     if not uploads_dir.exists():
         print(f"Error: {uploads_dir} directory not found!")
         return
-    
+
+    # Create output directory if it doesn't exist
+    if mode != "manifest":
+        output_dir.mkdir(exist_ok=True)
+
     # Counter for processed images
     processed_count = 0
+    skipped_count = 0
     missing_count = 0
-    
-    # Iterate through all subdirectories in uploads
-    for folder in uploads_dir.iterdir():
-        if folder.is_dir():
-            # Look for the target image file
-            target_image = folder / "address_first_cropped_img.png"
-            
-            if target_image.exists():
-                # Create destination filename using folder name
-                folder_name = folder.name
-                destination = output_dir / f"{folder_name}.png"
-                
-                try:
-                    # Copy the image to the destination
-                    shutil.copy2(target_image, destination)
-                    print(f"✓ Copied: {folder_name}")
+    manifest_rows = []
+
+    # Scan all subdirectories in uploads
+    for folder_name, target_image, target_stat in scan_uploads(uploads_dir, workers=workers):
+        if target_stat is None:
+            print(f"✗ Missing address_first_cropped_img.png in: {folder_name}")
+            missing_count += 1
+            continue
+
+        if mode == "manifest":
+            # Reference the image where it is
+            image_path = target_image
+        else:
+            # Create destination filename using folder name
+            destination = output_dir / f"{folder_name}.png"
+            image_path = str(destination)
+            try:
+                if _is_unchanged(mode, target_image, destination, target_stat):
+                    skipped_count += 1
+                else:
+                    # Remove the old entry first: copying onto a link would write through it
+                    if os.path.lexists(destination):
+                        os.remove(destination)
+                    if mode == "copy":
+                        shutil.copy2(target_image, destination)
+                    elif mode == "hardlink":
+                        os.link(target_image, destination)
+                    else:
+                        os.symlink(os.path.abspath(target_image), destination)
+                    print(f"✓ {mode.capitalize()}: {folder_name}")
                     processed_count += 1
-                except Exception as e:
-                    print(f"✗ Error copying {folder_name}: {e}")
+            except Exception as e:
+                print(f"✗ Error extracting {folder_name}: {e}")
+                continue
+
+        manifest_rows.append({
+            "upload_id": folder_name,
+            "image_path": image_path,
+            "size": target_stat.st_size,
+            "mtime_ns": target_stat.st_mtime_ns,
+        })
+
+    if mode == "manifest":
+        previous = read_manifest(manifest_path)
+        for row in manifest_rows:
+            old = previous.get(row["upload_id"])
+            if old and old["image_path"] == row["image_path"] and int(old["mtime_ns"]) == row["mtime_ns"]:
+                skipped_count += 1
             else:
-                print(f"✗ Missing address_first_cropped_img.png in: {folder.name}")
-                missing_count += 1
-    
+                processed_count += 1
+
+    with open(manifest_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS)
+        writer.writeheader()
+        writer.writerows(manifest_rows)
+
+    if tensor_store_path:
+        from tensor_store import build_tensor_store
+        build_tensor_store(((row["upload_id"], row["image_path"]) for row in manifest_rows), tensor_store_path)
+
     # Print summary
     print(f"\n--- Summary ---")
+    print(f"Mode: {mode}")
     print(f"Successfully processed: {processed_count} images")
+    print(f"Unchanged (skipped): {skipped_count} images")
     print(f"Missing images: {missing_count}")
-    print(f"Images saved to: {output_dir.absolute()}")
+    if mode == "manifest":
+        print(f"Images referenced in place from: {uploads_dir.absolute()}")
+    else:
+        print(f"Images saved to: {output_dir.absolute()}")
+    print(f"Manifest: {manifest_path}")
+    return len(manifest_rows)
 
 if __name__ == "__main__":
-    extract_address_images()
\ No newline at end of file
+    extract_address_images()
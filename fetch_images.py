@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import random
+from urllib.parse import urlsplit
+
+from tqdm import tqdm
+
+import instrumentation
+from extract_address_img import MANIFEST_COLUMNS
+from nid_storage import read_table
+
+# Columns of nid_infos_compared_*.csv holding image URLs
+IMAGE_URL_COLUMNS = ["nid_image_front", "nid_image_back", "selfie_photo", "person_photo"]
+REMOTE_CACHE_DIR = "remote images"
+# HTTP statuses worth another attempt; any other error status fails at once
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def object_path(content_hash, suffix, cache_dir=REMOTE_CACHE_DIR):
+    """Content-addressed location of a downloaded file: objects/<2 hex>/<hash><suffix>"""
+    return os.path.join(cache_dir, "objects", content_hash[:2], f"{content_hash}{suffix}")
+
+def url_index_path(cache_dir=REMOTE_CACHE_DIR):
+    return os.path.join(cache_dir, "url_index.json")
+
+def manifest_path(column, cache_dir=REMOTE_CACHE_DIR):
+    """Per-column manifest in the extract_address_images format, for check.py"""
+    return os.path.join(cache_dir, f"{column}_manifest.csv")
+
+def load_url_index(cache_dir=REMOTE_CACHE_DIR):
+    """{url: {'hash', 'path', 'size'}} of earlier downloads whose file is still present"""
+    path = url_index_path(cache_dir)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable URL index {path}: {e}")
+        return {}
+    return {url: entry for url, entry in index.items() if os.path.exists(entry["path"])}
+
+def save_url_index(index, cache_dir=REMOTE_CACHE_DIR):
+    path = url_index_path(cache_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+def store_object(data, url, cache_dir=REMOTE_CACHE_DIR):
+    """
+    Write downloaded bytes under their content hash. Identical images behind
+    different URLs are stored once. Returns the index entry for the URL.
+    """
+    content_hash = hashlib.blake2b(data, digest_size=20).hexdigest()
+    suffix = os.path.splitext(urlsplit(url).path)[1].lower()
+    path = object_path(content_hash, suffix, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return {"hash": content_hash, "path": path, "size": len(data)}
+
+async def _fetch(session, semaphore, url, cache_dir, retries, backoff):
+    """Download one URL with retries; returns (url, entry or None, error or None)"""
+    import aiohttp
+
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            instrumentation.increment("download_retries")
+            # Exponential backoff with jitter so retries do not arrive in lockstep
+            await asyncio.sleep(backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+        async with semaphore:
+            start = asyncio.get_running_loop().time()
+            try:
+                async with session.get(url) as response:
+                    if response.status != 200:
+                        error = f"HTTP {response.status}"
+                        if response.status in RETRY_STATUSES:
+                            continue
+                        return url, None, error
+                    data = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
+            finally:
+                instrumentation.record("download", asyncio.get_running_loop().time() - start)
+        entry = await asyncio.to_thread(store_object, data, url, cache_dir)
+        return url, entry, None
+    return url, None, error
+
+async def fetch_all(urls, cache_dir=REMOTE_CACHE_DIR, concurrency=32, retries=3, timeout=60, backoff=0.5):
+    """
+    Download urls over one pooled session with at most concurrency requests in
+    flight. Yields (url, entry or None, error or None) as downloads complete.
+    """
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        tasks = [asyncio.create_task(_fetch(session, semaphore, url, cache_dir, retries, backoff)) for url in urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+async def _download(urls, index, cache_dir, concurrency, retries, timeout):
+    failures = {}
+    with tqdm(total=len(urls), desc="Downloading images", unit="image") as progress:
+        async for url, entry, error in fetch_all(urls, cache_dir, concurrency, retries, timeout):
+            if entry is None:
+                failures[url] = error
+                instrumentation.increment("download_failures")
+            else:
+                index[url] = entry
+                instrumentation.increment("downloads")
+            progress.update()
+    return failures
+
+def write_manifests(records, index, columns, cache_dir=REMOTE_CACHE_DIR):
+    """
+    One manifest per URL column mapping upload_id to its downloaded image, so
+    check.process_images_and_create_csv(manifest_path=...) analyses them in place.
+    Returns {column: manifest path} for the columns with at least one image.
+    """
+    manifests = {}
+    for column in columns:
+        rows = {}
+        for upload_id, url in zip(records['upload_id'], records[column]):
+            entry = index.get(url)
+            if entry is None or upload_id in rows:
+                continue
+            stat = os.stat(entry["path"])
+            rows[upload_id] = {"upload_id": upload_id, "image_path": entry["path"],
+                               "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        path = manifest_path(column, cache_dir)
+        if not rows:
+            # Nothing downloaded for this column; drop any manifest from an earlier run
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        manifests[column] = path
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows.values())
+    return manifests
+
+@instrumentation.instrumented_run("fetch")
+def fetch_images(csv_file="nid_infos_compared_31-07-25_12-14.csv", columns=IMAGE_URL_COLUMNS,
+                 cache_dir=REMOTE_CACHE_DIR, concurrency=32, retries=3, timeout=60):
+    """
+    Download the card and photo images referenced by URL in csv_file.
+    URLs already in the local cache are not requested again, and each distinct
+    URL is fetched once however many rows share it. Writes one manifest per
+    column (see write_manifests) and returns {column: manifest path}.
+    """
+    columns = list(columns)
+    records = read_table(csv_file, columns=['upload_id'] + columns)
+    records = records[records['upload_id'].notna()]
+    os.makedirs(cache_dir, exist_ok=True)
+
+    index = load_url_index(cache_dir)
+    urls = {url for column in columns for url in records[column].dropna() if str(url).startswith(("http://", "https://"))}
+    missing = sorted(url for url in urls if url not in index)
+    instrumentation.increment("download_cache_hits", len(urls) - len(missing))
+    print(f"Found {len(urls)} image URLs, cached: {len(urls) - len(missing)}, to download: {len(missing)}")
+
+    failures = {}
+    try:
+        if missing:
+            failures = asyncio.run(_download(missing, index, cache_dir, concurrency, retries, timeout))
+    finally:
+        # Keep whatever was downloaded, even if the run was interrupted
+        save_url_index(index, cache_dir)
+
+    manifests = write_manifests(records, index, columns, cache_dir)
+
+    print(f"\n--- Download Summary ---")
+    print(f"Downloaded: {len(missing) - len(failures)}")
+    print(f"Failed: {len(failures)}")
+    for url, error in list(failures.items())[:10]:
+        print(f"✗ {url}: {error}")
+    for column, path in manifests.items():
+        print(f"Manifest ({column}): {path}")
+    return manifests
+
+def analyse_fetched_images(manifests, workers=None, analysis_width=None):
+    """
+    Blur and angle of the downloaded images through check.py, one results CSV
+    (and result cache and quarantine report) per column: <column>_analysis_results.csv
+    with image_name = <upload_id>.png as for the address crops.
+    """
+    from check import process_images_and_create_csv
+
+    results = {}
+    for column, path in manifests.items():
+        results[column] = f"{column}_analysis_results.csv"
+        process_images_and_create_csv(csv_path=results[column], workers=workers,
+                                      cache_path=f"{column}_analysis_cache.json", manifest_path=path,
+                                      analysis_width=analysis_width, quarantine_path=f"{column}_quarantine.csv")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the images referenced by URL in the NID CSV")
+    parser.add_argument("--csv", default="nid_infos_compared_31-07-25_12-14.csv")
+    parser.add_argument("--columns", nargs="+", default=IMAGE_URL_COLUMNS)
+    parser.add_argument("--cache-dir", default=REMOTE_CACHE_DIR)
+    parser.add_argument("--concurrency", type=int, default=32, help="max requests in flight")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds per request")
+    parser.add_argument("--analyse", action="store_true", help="run check.py blur/angle analysis on the downloads")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--analysis-width", type=int, default=None)
+    args = parser.parse_args()
+
+    manifests = fetch_images(args.csv, args.columns, args.cache_dir, args.concurrency, args.retries, args.timeout)
+    if args.analyse:
+        analyse_fetched_images(manifests, args.workers, args.analysis_width)
@@ -0,0 +1,100 @@
+import os
+import struct
+
+# Status codes recorded for every analysed image
+STATUS_OK = "ok"
+STATUS_ANGLE_NOT_FOUND = "angle_not_found"  # image is fine, but no usable lines for an angle
+# The file itself is unusable; such images are quarantined and kept out of the merge
+FILE_ERROR_STATUSES = ("missing", "empty", "unknown_format", "truncated", "corrupt_header", "decode_failed")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC), which carry the dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Formats accepted without a structural check; decoding decides
+OTHER_SIGNATURES = {b"BM": "bmp", b"II*\x00": "tiff", b"MM\x00*": "tiff"}
+
+def _result(status, fmt=None, width=None, height=None, size=None):
+    return {'status': status, 'format': fmt, 'width': width, 'height': height, 'size': size}
+
+def _probe_png(f, size):
+    f.seek(8)
+    header = f.read(25)
+    if len(header) < 25:
+        return _result("truncated", "png", size=size)
+    length, chunk_type, width, height = struct.unpack(">I4sII", header[:16])
+    if chunk_type != b"IHDR" or length != 13 or width == 0 or height == 0:
+        return _result("corrupt_header", "png", size=size)
+    # A complete PNG ends with the IEND chunk
+    f.seek(max(0, size - len(PNG_IEND)))
+    if f.read() != PNG_IEND:
+        return _result("truncated", "png", width, height, size)
+    return _result(STATUS_OK, "png", width, height, size)
+
+def _probe_jpeg(f, size):
+    # Walk the marker segments up to the start-of-frame, seeking past each payload
+    f.seek(2)
+    width = height = None
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2:
+            return _result("truncated", "jpeg", size=size)
+        if marker[0] != 0xFF:
+            return _result("corrupt_header", "jpeg", size=size)
+        code = marker[1]
+        if code == 0xFF:
+            # Fill byte before the marker
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return _result("truncated", "jpeg", size=size)
+        length = struct.unpack(">H", length_bytes)[0]
+        if length < 2:
+            return _result("corrupt_header", "jpeg", size=size)
+        if code in JPEG_SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return _result("truncated", "jpeg", size=size)
+            height, width = struct.unpack(">xHH", frame)
+            break
+        if code == 0xDA:
+            # Scan data before any frame header
+            return _result("corrupt_header", "jpeg", size=size)
+        f.seek(length - 2, os.SEEK_CUR)
+    if width == 0 or height == 0:
+        return _result("corrupt_header", "jpeg", width, height, size)
+    # A complete JPEG ends with the EOI marker (some encoders pad a few bytes after it)
+    f.seek(max(0, size - 32))
+    if b"\xff\xd9" not in f.read():
+        return _result("truncated", "jpeg", width, height, size)
+    return _result(STATUS_OK, "jpeg", width, height, size)
+
+def probe_image(image_path):
+    """
+    Check an image from its header and trailer only, without decoding pixels.
+    Returns {'status', 'format', 'width', 'height', 'size'}; status is "ok" or
+    one of FILE_ERROR_STATUSES. PNG and JPEG are checked for a valid header,
+    dimensions and a complete end marker; BMP and TIFF are only identified.
+    """
+    try:
+        size = os.path.getsize(image_path)
+    except OSError:
+        return _result("missing")
+    if size == 0:
+        return _result("empty", size=size)
+    try:
+        with open(image_path, "rb") as f:
+            signature = f.read(8)
+            if signature == PNG_SIGNATURE:
+                return _probe_png(f, size)
+            if signature[:3] == b"\xff\xd8\xff":
+                return _probe_jpeg(f, size)
+    except OSError:
+        return _result("missing", size=size)
+    for prefix, fmt in OTHER_SIGNATURES.items():
+        if signature.startswith(prefix):
+            return _result(STATUS_OK, fmt, size=size)
+    return _result("unknown_format", size=size)
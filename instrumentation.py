@@ -0,0 +1,150 @@
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+# Histogram bucket upper bounds in seconds: 10 µs to ~200 s, 25% apart.
+# Fixed buckets keep memory constant and let worker histograms be merged.
+BUCKET_BOUNDS = [1e-5 * 1.25 ** i for i in range(76)]
+
+REPORT_DIR = os.environ.get("NID_REPORT_DIR", "reports")
+PROFILE_DIR = os.environ.get("NID_PROFILE_DIR")
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_histograms = {}
+
+def _new_histogram():
+    return {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0, 'buckets': {}}
+
+def record(stage, seconds):
+    """Add one duration to the histogram of stage"""
+    bucket = min(bisect.bisect_left(BUCKET_BOUNDS, seconds), len(BUCKET_BOUNDS) - 1)
+    with _lock:
+        histogram = _histograms.setdefault(stage, _new_histogram())
+        histogram['count'] += 1
+        histogram['total'] += seconds
+        histogram['max'] = max(histogram['max'], seconds)
+        histogram['last'] = seconds
+        histogram['buckets'][bucket] = histogram['buckets'].get(bucket, 0) + 1
+
+def increment(counter, value=1):
+    with _lock:
+        _counters[counter] += value
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block under stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def timed_function(stage):
+    """Decorator form of timed"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def snapshot(reset_after=False):
+    """Picklable copy of the counters and histograms (e.g. to send back from a worker)"""
+    with _lock:
+        data = {
+            'counters': dict(_counters),
+            'histograms': {stage: {**h, 'buckets': dict(h['buckets'])} for stage, h in _histograms.items()},
+        }
+        if reset_after:
+            _counters.clear()
+            _histograms.clear()
+    return data
+
+def merge(data):
+    """Fold a snapshot from another process into this one"""
+    with _lock:
+        for counter, value in data['counters'].items():
+            _counters[counter] += value
+        for stage, other in data['histograms'].items():
+            histogram = _histograms.setdefault(stage, _new_histogram())
+            histogram['count'] += other['count']
+            histogram['total'] += other['total']
+            histogram['max'] = max(histogram['max'], other['max'])
+            histogram['last'] = other['last']
+            for bucket, count in other['buckets'].items():
+                histogram['buckets'][bucket] = histogram['buckets'].get(bucket, 0) + count
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _percentile(histogram, q):
+    """Upper bound of the bucket holding the q-th percentile"""
+    target = q / 100 * histogram['count']
+    seen = 0
+    for bucket in sorted(histogram['buckets']):
+        seen += histogram['buckets'][bucket]
+        if seen >= target:
+            return min(BUCKET_BOUNDS[bucket], histogram['max'])
+    return histogram['max']
+
+def summary():
+    """Per-stage count, total and latency percentiles (ms), plus counters"""
+    data = snapshot()
+    stages = {}
+    for stage, histogram in sorted(data['histograms'].items()):
+        count = histogram['count']
+        stages[stage] = {
+            'count': count,
+            'total_s': histogram['total'],
+            'mean_ms': 1000 * histogram['total'] / count if count else 0.0,
+            'p50_ms': 1000 * _percentile(histogram, 50),
+            'p90_ms': 1000 * _percentile(histogram, 90),
+            'p99_ms': 1000 * _percentile(histogram, 99),
+            'max_ms': 1000 * histogram['max'],
+            'last_ms': 1000 * histogram['last'],
+        }
+    return {'stages': stages, 'counters': data['counters']}
+
+def write_report(name, report_dir=REPORT_DIR):
+    """Write the current summary to <report_dir>/<name>_<timestamp>.json"""
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({'run': name, 'finished': time.strftime("%Y-%m-%dT%H:%M:%S"), **summary()}, f, indent=2)
+    return path
+
+def instrumented_run(name):
+    """
+    Decorator for pipeline entry points: starts from empty counters, times the
+    whole call, writes a report afterwards and, when NID_PROFILE_DIR is set,
+    dumps a cProfile file for the run there as well.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            reset()
+            profiler = cProfile.Profile() if PROFILE_DIR else None
+            start = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if profiler:
+                    profiler.disable()
+                    os.makedirs(PROFILE_DIR, exist_ok=True)
+                    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}.prof"))
+                record(f"{name}.total", time.perf_counter() - start)
+                print(f"Timing report: {write_report(name)}")
+        return wrapper
+    return decorator
@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pandas as pd
+
+# File suffix -> storage format
+STORAGE_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".feather": "arrow",
+    ".arrow": "arrow",
+}
+
+CATEGORICAL_COLUMNS = ["vendor"]
+FLOAT32_COLUMNS = ["detected_blur", "detected_angle", "tenengrad", "brightness", "contrast",
+                   "overexposed_fraction", "noise_sigma", "text_density", "skew_angle"]
+# Text columns where at most this share of the values is distinct are dictionary-encoded
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+def storage_format(path):
+    """Storage format of a data file, from its suffix"""
+    suffix = os.path.splitext(str(path))[1].lower()
+    if suffix not in STORAGE_FORMATS:
+        raise ValueError(f"Unsupported data file {path}, expected one of {', '.join(STORAGE_FORMATS)}")
+    return STORAGE_FORMATS[suffix]
+
+def optimize_dtypes(df):
+    """
+    Compact column types for columnar storage: categorical vendor and
+    float32 metrics/accuracies. Returns a new DataFrame.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if column in CATEGORICAL_COLUMNS:
+            df[column] = df[column].astype("category")
+        elif column in FLOAT32_COLUMNS or column.endswith("_accuracy"):
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float32")
+    return df
+
+def compact_strings(df, max_unique_ratio=CATEGORY_MAX_UNIQUE_RATIO):
+    """
+    Hold text columns compactly instead of as one Python object per cell:
+    dictionary-encoded (category) when values repeat, Arrow-backed strings
+    otherwise. Returns a new DataFrame; numeric columns are left alone.
+    """
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(values):
+            continue
+        if len(values) and values.nunique() <= max_unique_ratio * len(values):
+            df[column] = values.astype("category")
+        else:
+            df[column] = values.astype(pd.StringDtype("pyarrow"))
+    return df
+
+def table_columns(path):
+    """Column names of a data file, without reading its rows"""
+    fmt = storage_format(path)
+    if fmt == "csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    if fmt == "parquet":
+        from pyarrow import parquet
+        return parquet.read_schema(path).names
+
+    from pyarrow import ipc
+    with ipc.open_file(path) as reader:
+        return reader.schema.names
+
+def read_table(path, columns=None, compact=False):
+    """
+    Read a CSV, Parquet or Arrow IPC file, loading only the requested columns.
+    Parquet and Arrow files are memory-mapped rather than read into a buffer first.
+    With compact=True text columns are converted by compact_strings.
+    """
+    fmt = storage_format(path)
+    columns = list(columns) if columns is not None else None
+    if fmt == "csv":
+        df = pd.read_csv(path, usecols=columns)
+    elif fmt == "parquet":
+        df = pd.read_parquet(path, columns=columns, memory_map=True)
+    else:
+        from pyarrow import feather
+        df = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    return compact_strings(df) if compact else df
+
+def write_table(df, path):
+    """
+    Write a DataFrame in the format given by the file suffix.
+    Columnar formats get compact dtypes; CSV keeps full precision for export.
+    """
+    fmt = storage_format(path)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "parquet":
+        optimize_dtypes(df).to_parquet(path, index=False)
+    else:
+        optimize_dtypes(df).reset_index(drop=True).to_feather(path)
+
+def convert_table(source, destination, columns=None):
+    """Convert a data file between CSV, Parquet and Arrow IPC"""
+    df = read_table(source, columns=columns)
+    write_table(df, destination)
+    print(f"Converted {source} -> {destination} ({len(df)} rows, {len(df.columns)} columns)")
+
+if __name__ == "__main__":
+    # e.g. python nid_storage.py nid_infos_compared_31-07-25_12-14.csv nid_infos_compared_31-07-25_12-14.parquet
+    if len(sys.argv) != 3:
+        print("Usage: python nid_storage.py <source> <destination>")
+        sys.exit(1)
+    convert_table(sys.argv[1], sys.argv[2])
@@ -0,0 +1,193 @@
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from nid_storage import read_table, write_table
+
+# Ground-truth fields that have an OCR counterpart in nid_infos_compared_*.csv
+OCR_FIELDS = ['name_en', 'name_bn', 'father_name', 'mother_name', 'spouse_name', 'address']
+
+# similarity metrics:
+#   ratio          - difflib ratio on NFC-normalised, lower-cased code points. This is
+#                    what the existing *_ocr_v6_accuracy columns contain (reproduced exactly)
+#   grapheme_edit  - 1 - Levenshtein distance / longer length, counted in grapheme clusters
+METRICS = ("ratio", "grapheme_edit")
+
+# <field>_ocr_<version> text columns, e.g. address_ocr_v6 or name_en_ocr_v7
+_OCR_COLUMN = re.compile(r"^(?P<field>.+)_ocr_(?P<version>v\d+(?:\.\d+)*)$")
+
+_BN_CONSONANT = "[\u0995-\u09b9\u09dc-\u09df\u09f0\u09f1]"
+# Bengali signs (candrabindu..visarga, nukta, vowel signs, hasanta, au length mark),
+# ZWNJ/ZWJ and the Latin combining diacritics
+_COMBINING = "[\u0981-\u0983\u09bc\u09be-\u09cc\u09cd\u09d7\u200c\u200d\u0300-\u036f]"
+# A Bengali conjunct is consonant (+nukta) + hasanta (+ZWJ/ZWNJ) repeated before the
+# next consonant; any character then takes its vowel signs and other combining marks
+_GRAPHEME = re.compile(
+    f"(?:{_BN_CONSONANT}\u09bc?\u09cd[\u200c\u200d]?(?={_BN_CONSONANT}))*.{_COMBINING}*",
+    re.DOTALL,
+)
+
+def graphemes(text):
+    """Split text into user-perceived characters (Bengali conjuncts stay whole)"""
+    return _GRAPHEME.findall(text)
+
+def _edit_distance(a, b):
+    """
+    Levenshtein distance of two integer arrays. Each DP row is computed with
+    numpy; the left-to-right insertion chain becomes a cumulative minimum.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if len(b) == 0:
+        return len(a)
+    offsets = np.arange(len(b) + 1)
+    row = offsets.copy()
+    candidate = np.empty_like(row)
+    for symbol in a:
+        candidate[0] = row[0] + 1
+        np.minimum(row[1:] + 1, row[:-1] + (b != symbol), out=candidate[1:])
+        row = np.minimum.accumulate(candidate - offsets) + offsets
+    return int(row[-1])
+
+def _score_chunk(pairs, metric):
+    """Similarity of every (truth, ocr) pair in one chunk"""
+    if metric == "ratio":
+        return [SequenceMatcher(None, truth, ocr).ratio() for truth, ocr in pairs]
+
+    # Map the chunk's grapheme clusters to integers once, then compare int arrays
+    codes = {}
+    def encode(text):
+        return np.array([codes.setdefault(g, len(codes)) for g in graphemes(text)], dtype=np.int64)
+
+    scores = []
+    for truth, ocr in pairs:
+        a, b = encode(truth), encode(ocr)
+        longest = max(len(a), len(b))
+        scores.append(1.0 - _edit_distance(a, b) / longest if longest else 1.0)
+    return scores
+
+def _normalise(column):
+    return column.astype("string").str.normalize("NFC").str.lower()
+
+def score_column(truth, ocr, metric="ratio", workers=None, chunk_size=2000):
+    """
+    Similarity between a ground-truth column and its OCR column, for the whole
+    column at once. Missing values score 0.0 and identical strings 1.0 without
+    any per-row work; only the distinct remaining pairs are scored, spread
+    over a process pool.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {', '.join(METRICS)}")
+    truth, ocr = _normalise(truth), _normalise(ocr)
+    scores = np.zeros(len(truth), dtype=np.float64)
+
+    missing = (truth.isna() | ocr.isna()).to_numpy(dtype=bool)
+    equal = ~missing & (truth == ocr).to_numpy(dtype=bool, na_value=False)
+    scores[equal] = 1.0
+
+    todo = ~missing & ~equal
+    if not todo.any():
+        return scores
+
+    pairs = pd.DataFrame({'truth': truth[todo].to_numpy(dtype=object), 'ocr': ocr[todo].to_numpy(dtype=object)})
+    unique_pairs = pairs.drop_duplicates()
+    pair_list = list(unique_pairs.itertuples(index=False, name=None))
+    chunks = [pair_list[i:i + chunk_size] for i in range(0, len(pair_list), chunk_size)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        results = [_score_chunk(chunk, metric) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_score_chunk, chunks, [metric] * len(chunks)))
+
+    unique_pairs = unique_pairs.assign(score=np.concatenate([np.asarray(r, dtype=np.float64) for r in results]))
+    scores[todo] = pairs.merge(unique_pairs, on=['truth', 'ocr'], how='left')['score'].to_numpy()
+    return scores
+
+def _version_key(version):
+    return tuple(int(part) for part in version[1:].split("."))
+
+def ocr_versions(columns, with_accuracy=False):
+    """
+    {field: [versions]} for every <field>_ocr_<version> column, oldest version
+    first. With with_accuracy=True only versions that also have a
+    <field>_ocr_<version>_accuracy column are listed.
+    """
+    columns = set(columns)
+    versions = {}
+    for column in columns:
+        match = _OCR_COLUMN.match(column)
+        if match and (not with_accuracy or f"{column}_accuracy" in columns):
+            versions.setdefault(match['field'], []).append(match['version'])
+    return {field: sorted(found, key=_version_key) for field, found in sorted(versions.items())}
+
+def ocr_columns(fields, versions, available):
+    """
+    [accuracy, text] column pairs for each field and version, in that order,
+    keeping only columns present in available. versions=None means every
+    version found in available.
+    """
+    found = ocr_versions(available)
+    columns = []
+    for field in fields:
+        for version in (found.get(field, []) if versions is None else versions):
+            for column in (f"{field}_ocr_{version}_accuracy", f"{field}_ocr_{version}"):
+                if column in available:
+                    columns.append(column)
+    return columns
+
+def accuracy_columns(df, version="v6", fields=None):
+    """(field, ocr column, accuracy column) for every field present in df"""
+    fields = fields or OCR_FIELDS
+    return [
+        (field, f"{field}_ocr_{version}", f"{field}_ocr_{version}_accuracy")
+        for field in fields
+        if field in df.columns and f"{field}_ocr_{version}" in df.columns
+    ]
+
+def score_dataframe(df, version="v6", fields=None, metric="ratio", workers=None):
+    """
+    Recompute every <field>_ocr_<version>_accuracy column of df.
+    Existing accuracy columns are replaced in place; new ones are appended,
+    so the column layout matches nid_infos_compared_*.csv.
+    """
+    df = df.copy()
+    for field, ocr_column, accuracy_column in accuracy_columns(df, version, fields):
+        df[accuracy_column] = score_column(df[field], df[ocr_column], metric=metric, workers=workers)
+    return df
+
+def rescore_file(source, destination, version="v6", fields=None, metric="ratio", workers=None):
+    """Read an NID comparison file, recompute its accuracy columns and write it out"""
+    df = read_table(source)
+    columns = accuracy_columns(df, version, fields)
+    if not columns:
+        print(f"Error: No <field>/<field>_ocr_{version} column pairs found in {source}")
+        return None
+    df = score_dataframe(df, version, fields, metric, workers)
+    write_table(df, destination)
+
+    print("--- OCR Accuracy Complete ---")
+    print(f"Source: {source}")
+    print(f"Output: {destination}")
+    print(f"Metric: {metric}")
+    for field, _, accuracy_column in columns:
+        print(f"{accuracy_column}: mean {df[accuracy_column].mean():.3f}")
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute the *_ocr_<version>_accuracy columns of an NID comparison file")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--version", default="v6", help="OCR version suffix, e.g. v6 for *_ocr_v6")
+    parser.add_argument("--fields", nargs="+", default=None)
+    parser.add_argument("--metric", choices=METRICS, default="ratio")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    rescore_file(args.source, args.destination, args.version, args.fields, args.metric, args.workers)
@@ -0,0 +1,175 @@
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from check import analyze_image, _analyze_with_stats, _init_worker, QUALITY_COLUMNS
+from image_validation import FILE_ERROR_STATUSES
+import instrumentation
+from instrumentation import timed
+from nid_storage import read_table, table_columns
+from ocr_accuracy import ocr_columns
+
+# Image metrics written for every row, between the ids and the OCR columns
+ANALYSIS_COLUMNS = ['detected_blur', 'detected_angle'] + QUALITY_COLUMNS
+
+def iter_upload_images(uploads_dir="uploads", image_name="address_first_cropped_img.png"):
+    """
+    Yield (upload_id, image_path) for every upload folder as it is discovered.
+    The image is referenced in place, nothing is copied.
+    """
+    with os.scandir(uploads_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            image_path = os.path.join(entry.path, image_name)
+            if os.path.isfile(image_path):
+                yield entry.name, image_path
+            else:
+                print(f"✗ Missing {image_name} in: {entry.name}")
+
+def iter_analysis(items, workers=None, max_pending=None):
+    """
+    Analyze (upload_id, image_path) items over a process pool while they stream in.
+    At most max_pending images are in flight, so memory stays bounded no matter
+    how many uploads there are. Yields (upload_id, image_path, metrics) in input order.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = workers * 4
+
+    if workers <= 1:
+        for upload_id, image_path in items:
+            yield upload_id, image_path, analyze_image(image_path)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for upload_id, image_path in items:
+            pending.append((upload_id, image_path, executor.submit(_analyze_with_stats, image_path)))
+            if len(pending) >= max_pending:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+
+def _collect(upload_id, image_path, future):
+    metrics, stats = future.result()
+    instrumentation.merge(stats)
+    return upload_id, image_path, metrics
+
+def load_nid_records(csv_file, columns=('id', 'upload_id', 'address_ocr_v6_accuracy', 'address_ocr_v6')):
+    """
+    Read only the needed NID columns and group the records by upload_id.
+    Records without an upload_id are grouped under None; no upload matches
+    them, so they are written without an image, as create_filtered_csv does.
+    """
+    with timed("csv_read"):
+        df = read_table(csv_file, columns=columns)
+    records = {}
+    for record in df.to_dict('records'):
+        upload_id = record['upload_id'] if pd.notna(record['upload_id']) else None
+        records.setdefault(upload_id, []).append(record)
+    return records
+
+def iter_rows(analysed, records):
+    """
+    Turn analysis results into output rows, one per NID record of that upload.
+    Records whose upload had no image are emitted at the end without blur/angle
+    and with an empty status, so a resumed run looks for their image again.
+    Images with a file-error status are written without an image_path.
+    records is consumed as rows are produced.
+    """
+    for upload_id, image_path, metrics in analysed:
+        if metrics.get('status') in FILE_ERROR_STATUSES:
+            image_path = ""
+        for record in records.pop(upload_id, []):
+            yield {**record, **metrics, 'image_path': image_path}
+
+    for upload_records in records.values():
+        for record in upload_records:
+            yield {**record, **dict.fromkeys(ANALYSIS_COLUMNS), 'status': "", 'image_path': ""}
+
+def read_completed_rows(output_file, records, output_columns):
+    """
+    (rows, upload_ids) of the uploads an earlier, possibly interrupted, run
+    finished. An upload is finished once every one of its NID records was
+    written with an image path or a final status. Uploads still waiting for
+    their image, or cut off between records, are left out so they run again.
+    An output written with other columns (other OCR fields or versions, or by
+    an older version of the pipeline) is not resumed at all.
+    """
+    if not os.path.exists(output_file):
+        return [], set()
+    with open(output_file, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != output_columns:
+            print(f"Columns of {output_file} differ from this run; starting over")
+            return [], set()
+        rows = list(reader)
+    written = {}
+    for row in rows:
+        if row.get('upload_id') and (row.get('image_path') or row.get('status')):
+            written.setdefault(row['upload_id'], set()).add(row.get('id'))
+    completed = {
+        upload_id for upload_id, ids in written.items()
+        if upload_id in records and {str(record['id']) for record in records[upload_id]} <= ids
+    }
+    return [row for row in rows if row.get('upload_id') in completed], completed
+
+@instrumentation.instrumented_run("streaming_pipeline")
+def run_streaming_pipeline(uploads_dir="uploads", csv_file="nid_infos_compared_31-07-25_12-14.csv",
+                           output_file="filtered_nid_data_with_images.csv", workers=None, max_pending=None,
+                           resume=True, fields=("address",), versions=("v6",)):
+    """
+    Extract, analyse and merge in one streaming pass.
+    Each upload folder flows through image lookup, analysis and row creation as it
+    is discovered, and rows are appended to output_file as soon as they are ready.
+    With resume=True, uploads already finished in output_file are skipped (see
+    read_completed_rows); rows of unfinished ones are dropped and redone.
+    fields and versions select the OCR columns, as in create_filtered_csv.
+    """
+    if not os.path.exists(uploads_dir):
+        print(f"Error: {uploads_dir} directory not found!")
+        return
+
+    ocr = ocr_columns(fields, versions, table_columns(csv_file))
+    output_columns = ['id', 'upload_id'] + ANALYSIS_COLUMNS + ['status'] + ocr + ['image_path']
+    records = load_nid_records(csv_file, columns=['id', 'upload_id'] + ocr)
+    kept_rows, completed = read_completed_rows(output_file, records, output_columns) if resume else ([], set())
+    for upload_id in completed:
+        records.pop(upload_id, None)
+    # Start from the finished uploads only; replaced atomically so an interruption
+    # here still leaves the previous output
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=output_columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(kept_rows)
+    os.replace(tmp_path, output_file)
+
+    # Only analyse uploads that still have NID records waiting for them
+    items = (
+        (upload_id, image_path)
+        for upload_id, image_path in iter_upload_images(uploads_dir)
+        if upload_id in records
+    )
+
+    rows_written = 0
+    with open(output_file, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=output_columns, extrasaction="ignore")
+        for row in iter_rows(iter_analysis(items, workers=workers, max_pending=max_pending), records):
+            with timed("row_write"):
+                writer.writerow(row)
+                f.flush()
+            rows_written += 1
+
+    print(f"\n--- Streaming Pipeline Complete ---")
+    print(f"Resumed uploads skipped: {len(completed)}")
+    print(f"Rows written: {rows_written}")
+    print(f"Output CSV: {output_file}")
+
+if __name__ == "__main__":
+    run_streaming_pipeline()
@@ -1,16 +1,19 @@
 #!/bin/zsh
 # Run all NID processing steps with a single click
 
-# Step 1: Run image analysis (check.py)
-echo "Running image analysis (check.py)..."
-python3 check.py
+# Image analysis (check.py), merge (create_filtered_csv.py) and the Streamlit app
+# in one process; the analysis results are passed to the merge in memory.
+# Merged data is written as Parquet; use --output filtered_nid_data_with_images.csv to export CSV.
+# Add --versions all (and e.g. --fields address name_bn) to keep every OCR version side by side,
+# --extract to collect the crops from uploads/ first, --deskew to also write skew-corrected crops
+# (shown by the viewer's deskew toggle), or --no-serve to stop after merging (cron).
+# See python3 cli.py --help for the separate extract/analyse/merge/serve steps.
+python3 cli.py run "$@"
 
-# Step 2: Create filtered CSV (create_filtered_csv.py) with use_original_blur_angle=False
-echo "Creating filtered CSV (create_filtered_csv.py) with use_original_blur_angle=False..."
-python3 -c "import create_filtered_csv; create_filtered_csv.create_filtered_csv(use_original_blur_angle=False)"
+# Alternative: stream uploads straight through analysis and merge
+# (reads images in place, appends rows as they are ready, resumes if interrupted)
+# python3 pipeline.py
 
-# Step 3: Launch Streamlit app
-# You can close the terminal after the app launches
-
-echo "Launching Streamlit app..."
-streamlit run streamlit_app.py
+# Optional: download the full card/photo images referenced by URL and analyse them
+# (writes nid_image_front_analysis_results.csv etc.; already downloaded URLs are skipped)
+# python3 fetch_images.py --analyse
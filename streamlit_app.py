@@ -1,8 +1,21 @@
 import streamlit as st
 import pandas as pd
+import altair as alt
+import difflib
 import os
+import threading
+from collections import OrderedDict
 from PIL import Image
 import numpy as np
+from thumbnails import get_thumbnail
+from tensor_store import TensorStore, index_path
+from nid_storage import read_table
+from ocr_accuracy import ocr_versions
+from viewer_index import ViewerIndex
+from analytics import AGGREGATES_PATH as DEFAULT_AGGREGATES_PATH, ANGLE_BINS, BLUR_BINS, bin_labels, blur_threshold_table, cells_frame, load_aggregates, summarise
+import time
+import instrumentation
+from instrumentation import timed
 
 # Set page config
 st.set_page_config(
@@ -11,30 +24,307 @@ st.set_page_config(
     layout="wide"
 )
 
-def load_data():
-    """Load the CSV data"""
+# Candidate data files; the most recently written one is shown.
+# NID_DATA_FILE (os.pathsep-separated for several) overrides them, e.g. from cli.py serve.
+DATA_FILES = tuple(filter(None, os.environ.get("NID_DATA_FILE", "").split(os.pathsep))) or \
+    ("filtered_nid_data_with_images.parquet", "filtered_nid_data_with_images.csv")
+# Upper bound on decoded pixel data kept in memory across reruns
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Optional tensor store (see tensor_store.py): on request, thumbnails are built
+# from its grayscale crops instead of decoding the PNGs
+TENSOR_STORE_PATH = os.environ.get("NID_TENSOR_STORE")
+# Aggregates behind the Analytics mode (see analytics.py)
+AGGREGATES_PATH = os.environ.get("NID_AGGREGATES", DEFAULT_AGGREGATES_PATH)
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it does not exist"""
     try:
-        df = pd.read_csv("filtered_nid_data_with_images.csv")
-        return df
-    except FileNotFoundError:
-        st.error("CSV file not found! Please make sure 'filtered_nid_data_with_images.csv' exists in the current directory.")
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+@st.cache_resource(show_spinner="Loading data...", max_entries=2)
+def _read_data(path, signature):
+    # signature is part of the cache key, so a changed file is read again.
+    # The DataFrame is shared between reruns and sessions: treat it as read-only.
+    # Text is held dictionary-encoded or as Arrow strings so wide multi-version files fit.
+    return read_table(path, compact=True)
+
+def _current_data_file(paths):
+    """(signature, path) of the most recently written data file, or None"""
+    available = [(file_signature(path), path) for path in paths]
+    available = [(signature, path) for signature, path in available if signature is not None]
+    if not available:
+        st.error(f"Data file not found! Please make sure '{paths[-1]}' exists in the current directory.")
+        return None
+    return max(available)
+
+def load_data(paths=DATA_FILES):
+    """Load the data file (read once per version of the file on disk)"""
+    current = _current_data_file(paths)
+    if current is None:
         return None
+    with timed("load_data"):
+        return _read_data(current[1], current[0])
+
+@st.cache_resource(show_spinner="Indexing data...", max_entries=8)
+def _build_index(path, signature, accuracy_column, text_column):
+    return ViewerIndex(_read_data(path, signature), accuracy_column, text_column)
+
+def load_index(accuracy_column, text_column, paths=DATA_FILES):
+    """
+    Sorted index over the data file for one OCR field/version
+    (built once per version of the file on disk and column pair)
+    """
+    current = _current_data_file(paths)
+    if current is None:
+        return None
+    with timed("load_data"):
+        return _build_index(current[1], current[0], accuracy_column, text_column)
+
+def field_label(field):
+    return field.replace("_", " ").title()
+
+# Image-quality metrics from check.compute_quality_metrics offered as range filters
+QUALITY_FILTERS = {
+    'tenengrad': "Sharpness (Tenengrad)",
+    'brightness': "Brightness",
+    'contrast': "Contrast",
+    'overexposed_fraction': "Over-exposed Fraction (glare)",
+    'noise_sigma': "Noise (σ)",
+    'text_density': "Text Density",
+}
+
+# Row filters when comparing two OCR versions
+DIFF_FILTERS = ["All rows", "Text differs", "Improved", "Regressed"]
+
+def version_diff_mask(df, column, other_column, diff_filter):
+    """Boolean row mask comparing OCR column with other_column, or None for all rows"""
+    if diff_filter == "Text differs":
+        text = df[column].astype(pd.StringDtype("pyarrow")).fillna("")
+        other = df[other_column].astype(pd.StringDtype("pyarrow")).fillna("")
+        return (text != other).to_numpy(dtype=bool)
+    if diff_filter in ("Improved", "Regressed"):
+        accuracy = df[f"{column}_accuracy"].to_numpy(dtype=np.float64, na_value=np.nan)
+        other = df[f"{other_column}_accuracy"].to_numpy(dtype=np.float64, na_value=np.nan)
+        return other > accuracy if diff_filter == "Improved" else other < accuracy
+    return None
+
+@st.cache_resource(show_spinner="Comparing versions...", max_entries=8)
+def _build_diff_mask(path, signature, column, other_column, diff_filter):
+    return version_diff_mask(_read_data(path, signature), column, other_column, diff_filter)
+
+def load_diff_mask(column, other_column, diff_filter, paths=DATA_FILES):
+    """version_diff_mask over the data file (computed once per version of the file, column pair and filter)"""
+    current = _current_data_file(paths)
+    if current is None:
+        return None
+    return _build_diff_mask(current[1], current[0], column, other_column, diff_filter)
+
+def diff_markdown(old, new):
+    """Word-level diff of two predictions: removed words struck through, added words in bold"""
+    old_words = "" if pd.isna(old) else str(old)
+    new_words = "" if pd.isna(new) else str(new)
+    old_words, new_words = old_words.split(), new_words.split()
+    parts = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_words, new_words).get_opcodes():
+        if tag == "equal":
+            parts.append(" ".join(old_words[i1:i2]))
+            continue
+        if i2 > i1:
+            parts.append("~~" + " ".join(old_words[i1:i2]) + "~~")
+        if j2 > j1:
+            parts.append("**" + " ".join(new_words[j1:j2]) + "**")
+    return " ".join(parts)
+
+class ImageLRUCache:
+    """Decoded images bounded by total pixel bytes, least recently used evicted first"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # (path, signature) -> (image, nbytes)
+        self._keys_by_path = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path, signature):
+        with self._lock:
+            entry = self._entries.get((path, signature))
+            if entry is None:
+                return None
+            self._entries.move_to_end((path, signature))
+            return entry[0]
+
+    def put(self, path, signature, image):
+        nbytes = image.width * image.height * len(image.getbands())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            # A new signature for the same path means the file changed on disk
+            old_key = self._keys_by_path.get(path)
+            if old_key is not None:
+                self._evict(old_key)
+            self._entries[(path, signature)] = (image, nbytes)
+            self._keys_by_path[path] = (path, signature)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+            if self._keys_by_path.get(key[0]) == key:
+                del self._keys_by_path[key[0]]
+
+@st.cache_resource(max_entries=2)
+def _open_tensor_store(path, signature):
+    return TensorStore(path)
+
+def get_tensor_store():
+    """The tensor store named by NID_TENSOR_STORE (reopened when rebuilt), or None"""
+    if not TENSOR_STORE_PATH:
+        return None
+    signature = file_signature(index_path(TENSOR_STORE_PATH))
+    if signature is None:
+        return None
+    return _open_tensor_store(TENSOR_STORE_PATH, signature)
+
+@st.cache_resource
+def get_image_cache():
+    return ImageLRUCache(IMAGE_CACHE_MAX_BYTES)
 
 def display_image(image_path):
     """Display image if it exists"""
     if pd.isna(image_path) or image_path == "" or not image_path:
         return None
     
-    if os.path.exists(image_path):
+    # One stat both checks existence and detects changes on disk
+    signature = file_signature(image_path)
+    if signature is None:
+        st.warning(f"Image file not found: {image_path}")
+        return None
+
+    cache = get_image_cache()
+    image = cache.get(image_path, signature)
+    if image is None:
         try:
-            image = Image.open(image_path)
-            return image
+            with Image.open(image_path) as opened:
+                opened.load()
+                image = opened.copy()
         except Exception as e:
             st.error(f"Error loading image: {e}")
             return None
-    else:
-        st.warning(f"Image file not found: {image_path}")
-        return None
+        cache.put(image_path, signature, image)
+    return image
+
+def _open_gallery_card(card_id, image_path):
+    st.session_state["gallery_open"] = {"id": card_id, "image_path": image_path}
+
+def _close_gallery_card():
+    st.session_state.pop("gallery_open", None)
+
+@st.cache_resource(show_spinner="Loading aggregates...", max_entries=2)
+def _load_cells(path, signature):
+    return cells_frame(load_aggregates(path))
+
+def _binned(cells, accuracy_column):
+    """Mean accuracy per blur x angle bin, with readable bin labels"""
+    heat = summarise(cells[(cells['blur_bin'] >= 0) & (cells['angle_bin'] >= 0)], ['blur_bin', 'angle_bin'], accuracy_column)
+    heat['blur'] = [bin_labels(BLUR_BINS)[i] for i in heat['blur_bin']]
+    heat['angle'] = [bin_labels(ANGLE_BINS)[i] for i in heat['angle_bin']]
+    return heat
+
+def show_analytics(accuracy_column, label):
+    """
+    Accuracy against blur and angle, per vendor and per batch. Everything is
+    read from the aggregates create_filtered_csv precomputes, never from the rows.
+    """
+    signature = file_signature(AGGREGATES_PATH)
+    if signature is None:
+        st.info(f"No aggregates found. Run create_filtered_csv.py to build {AGGREGATES_PATH}.")
+        return
+    cells = _load_cells(AGGREGATES_PATH, signature)
+    if f"{accuracy_column}_sum" not in cells.columns:
+        st.info(f"The aggregates have no {accuracy_column} yet. Rerun create_filtered_csv.py for this column.")
+        return
+    st.caption("Computed from pre-aggregated statistics; the sidebar row filters do not apply here.")
+
+    batches = list(dict.fromkeys(cells['batch']))
+    chosen = st.multiselect("Batches", batches, default=batches)
+    selected = cells[cells['batch'].isin(chosen)]
+    if selected.empty:
+        st.warning("No batches selected.")
+        return
+
+    st.markdown(f"**{label} accuracy by blur and angle**")
+    heat = _binned(selected, accuracy_column)
+    blur_order = [b for b in bin_labels(BLUR_BINS) if b in set(heat['blur'])]
+    angle_order = [a for a in bin_labels(ANGLE_BINS) if a in set(heat['angle'])]
+    st.altair_chart(
+        alt.Chart(heat).mark_rect().encode(
+            x=alt.X('blur:O', sort=blur_order, title="Detected blur (Laplacian variance)"),
+            y=alt.Y('angle:O', sort=angle_order, title="Detected angle (°)"),
+            color=alt.Color('mean:Q', title="Mean accuracy", scale=alt.Scale(scheme="redyellowgreen")),
+            tooltip=['blur', 'angle', 'count', alt.Tooltip('mean:Q', format=".3f")],
+        ),
+        use_container_width=True,
+    )
+
+    st.markdown("**Minimum-blur threshold**")
+    thresholds = blur_threshold_table(selected, accuracy_column)
+    st.dataframe(thresholds.style.format({'min_blur': "{:g}", 'kept_share': "{:.1%}",
+                                          'kept_accuracy': "{:.3f}", 'rejected_accuracy': "{:.3f}"}),
+                 use_container_width=True, hide_index=True)
+
+    st.markdown("**Per vendor**")
+    vendors = summarise(selected, 'vendor', accuracy_column).rename(columns={'mean': 'mean_accuracy'})
+    vendors['mean_blur'] = summarise(selected, 'vendor', 'detected_blur')['mean']
+    vendor_col1, vendor_col2 = st.columns([3, 2])
+    with vendor_col1:
+        by_vendor_blur = summarise(selected[selected['blur_bin'] >= 0], ['vendor', 'blur_bin'], accuracy_column)
+        by_vendor_blur['blur'] = [bin_labels(BLUR_BINS)[i] for i in by_vendor_blur['blur_bin']]
+        st.altair_chart(
+            alt.Chart(by_vendor_blur).mark_line(point=True).encode(
+                x=alt.X('blur:O', sort=blur_order, title="Detected blur"),
+                y=alt.Y('mean:Q', title="Mean accuracy"),
+                color='vendor:N',
+                tooltip=['vendor', 'blur', 'count', alt.Tooltip('mean:Q', format=".3f")],
+            ),
+            use_container_width=True,
+        )
+    with vendor_col2:
+        st.dataframe(vendors, use_container_width=True, hide_index=True)
+
+    st.markdown("**Batch drift**")
+    drift = summarise(cells, 'batch', accuracy_column).rename(columns={'mean': 'mean_accuracy'})
+    drift['mean_blur'] = summarise(cells, 'batch', 'detected_blur')['mean']
+    drift['mean_angle'] = summarise(cells, 'batch', 'detected_angle')['mean']
+    drift = drift.set_index('batch').loc[batches].reset_index()
+    st.dataframe(drift, use_container_width=True, hide_index=True)
+    if len(batches) >= 2:
+        drift_col1, drift_col2 = st.columns(2)
+        with drift_col1:
+            baseline = st.selectbox("Baseline batch", batches, index=len(batches) - 2)
+        with drift_col2:
+            current = st.selectbox("Compared batch", batches, index=len(batches) - 1)
+        per_batch = summarise(cells[cells['batch'].isin([baseline, current]) & (cells['blur_bin'] >= 0)],
+                              ['batch', 'blur_bin'], accuracy_column)
+        per_batch = per_batch.pivot(index='blur_bin', columns='batch', values='mean').reindex(columns=[baseline, current])
+        per_batch['change'] = per_batch[current] - per_batch[baseline]
+        per_batch.index = [bin_labels(BLUR_BINS)[i] for i in per_batch.index]
+        st.dataframe(per_batch.style.format("{:.3f}", na_rep="–"), use_container_width=True)
+
+def show_timings(placeholder):
+    """Live per-stage timings of this server process (all reruns so far)"""
+    stages = instrumentation.summary()['stages']
+    if stages:
+        timings = pd.DataFrame(stages).T[['count', 'last_ms', 'mean_ms', 'p90_ms', 'max_ms']]
+        placeholder.dataframe(timings.round(1), use_container_width=True)
 
 def main():
     st.title("📊 NID Data Viewer with Address Images")
@@ -44,67 +334,161 @@ def main():
     df = load_data()
     if df is None:
         return
-    
+
     # Sidebar filters
     st.sidebar.header("🔍 Filters")
+
+    # OCR field and version, from the <field>_ocr_<version>[_accuracy] columns in the data
+    versions = ocr_versions(df.columns, with_accuracy=True)
+    if not versions:
+        st.error("No <field>_ocr_<version> and matching _accuracy columns found in the data file.")
+        return
+    fields = list(versions)
+    field = st.sidebar.selectbox("OCR Field", fields, index=fields.index("address") if "address" in fields else 0,
+                                 format_func=field_label)
+    version = st.sidebar.selectbox("OCR Version", versions[field][::-1])
+    text_column = f"{field}_ocr_{version}"
+    accuracy_column = f"{text_column}_accuracy"
+    label = field_label(field)
+
+    # Optional second version of the same field to diff against
+    other_versions = [v for v in versions[field][::-1] if v != version]
+    compare_column = None
+    diff_filter = DIFF_FILTERS[0]
+    if other_versions:
+        compare_version = st.sidebar.selectbox("Compare With Version", ["None"] + other_versions)
+        if compare_version != "None":
+            compare_column = f"{field}_ocr_{compare_version}"
+            diff_filter = st.sidebar.radio(f"Rows ({compare_version} vs {version})", DIFF_FILTERS)
+
+    # Sorted index for the chosen column pair
+    index = load_index(accuracy_column, text_column)
+    if index is None:
+        return
     
     # Debug section
     with st.sidebar.expander("🔧 Debug Info"):
+        rows_with_path = len(index.image_rows)
         st.write(f"Total rows in CSV: {len(df)}")
-        st.write(f"Rows with non-empty image_path: {len(df[df['image_path'].notna() & (df['image_path'] != '')])}")
+        st.write(f"Rows with non-empty image_path: {rows_with_path}")
         if len(df) > 0:
-            sample_path = df[df['image_path'].notna() & (df['image_path'] != '')].iloc[0]['image_path'] if len(df[df['image_path'].notna() & (df['image_path'] != '')]) > 0 else "No valid paths"
+            sample_path = df['image_path'].iloc[index.image_rows[0]] if rows_with_path > 0 else "No valid paths"
             st.write(f"Sample image path: {sample_path}")
             if sample_path != "No valid paths":
-                st.write(f"File exists: {os.path.exists(sample_path)}")
+                st.write(f"File exists: {file_signature(sample_path) is not None}")
+        image_cache = get_image_cache()
+        st.write(f"Image cache: {len(image_cache)} images, {image_cache.current_bytes / 1e6:.1f} MB")
+        st.write("Timings (ms):")
+        timings_placeholder = st.empty()
     
     # Filter by accuracy range
     min_accuracy = st.sidebar.slider(
-        "Minimum Address OCR Accuracy", 
+        f"Minimum {label} OCR Accuracy", 
         min_value=0.0, 
         max_value=1.0, 
         value=0.0, 
         step=0.1
     )
     
-    # Filter by blur range
-    min_blur = st.sidebar.slider(
-        "Minimum Detected Blur", 
-        min_value=float(df['detected_blur'].min()), 
-        max_value=float(df['detected_blur'].max()), 
-        value=float(df['detected_blur'].min()),
-        step=100.0
-    )
+    # Filter by blur range (slider bounds come from the sorted index, not a scan of the data)
+    min_blur = None
+    if len(index.by_blur.values):
+        blur_min, blur_max = float(index.by_blur.values[0]), float(index.by_blur.values[-1])
+        min_blur = st.sidebar.slider(
+            "Minimum Detected Blur",
+            min_value=blur_min,
+            max_value=blur_max,
+            value=blur_min,
+            step=100.0
+        )
+    
+    # Filter by angle range
+    angle_range = None
+    angle_min, angle_max = index.by_angle.bounds or (None, None)
+    if angle_min is not None and angle_min < angle_max:
+        angle_range = st.sidebar.slider(
+            "Detected Angle Range (°)",
+            min_value=float(angle_min),
+            max_value=float(angle_max),
+            value=(float(angle_min), float(angle_max)),
+            step=0.5
+        )
+        # The full range is no filter: rows without a detected angle stay in
+        if angle_range == (float(angle_min), float(angle_max)):
+            angle_range = None
+
+    # Image-quality ranges, for the metrics present in the data
+    quality_ranges = {}
+    quality_columns = [column for column in QUALITY_FILTERS if column in df.columns]
+    if quality_columns:
+        with st.sidebar.expander("🧪 Image Quality"):
+            for column in quality_columns:
+                low, high = index.column(column)[1].bounds or (None, None)
+                if low is not None and low < high:
+                    quality_range = st.slider(
+                        QUALITY_FILTERS[column],
+                        min_value=float(low),
+                        max_value=float(high),
+                        value=(float(low), float(high)),
+                        step=float(high - low) / 100
+                    )
+                    # Untouched sliders do not filter, so rows missing the metric stay in
+                    if quality_range != (float(low), float(high)):
+                        quality_ranges[column] = quality_range
+
+    # Skew-corrected crops from deskew.py, where the merged data has them
+    show_deskewed = False
+    if 'deskewed_path' in df.columns:
+        show_deskewed = st.sidebar.toggle("Show Deskewed Images", value=False,
+                                          help="Crops rotated level by deskew.py; straight crops are shown as they are")
+
+    # Grayscale thumbnails from the tensor store are faster but drop colour,
+    # which reviewers need for glare and stamps, so they are opt-in
+    thumbnail_store = None
+    if TENSOR_STORE_PATH and get_tensor_store() is not None:
+        if st.sidebar.toggle("Fast Grayscale Thumbnails", value=False,
+                             help="Build thumbnails from the tensor store's grayscale crops"):
+            thumbnail_store = get_tensor_store()
+
+    # Search in the predicted text
+    search_text = st.sidebar.text_input(f"Search Predicted {label}", value="").strip()
     
-    # Filter data
-    filtered_df = df[
-        (df['address_ocr_v6_accuracy'] >= min_accuracy) & 
-        (df['detected_blur'] >= min_blur)
-    ]
+    # Filter data (binary search on the sorted index; rows come back sorted by blur)
+    with timed("filter"):
+        mask = load_diff_mask(text_column, compare_column, diff_filter) if compare_column else None
+        selection = index.select(min_accuracy, min_blur, angle_range, search_text or None, mask, quality_ranges)
+        stats = selection.metrics()
     
     # Display statistics
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Records", len(filtered_df))
+        st.metric("Total Records", stats['count'])
     with col2:
-        st.metric("With Images", len(filtered_df[filtered_df['image_path'] != ""]))
+        st.metric("With Images", stats['with_images'])
     with col3:
-        st.metric("Avg Accuracy", f"{filtered_df['address_ocr_v6_accuracy'].mean():.3f}")
+        st.metric("Avg Accuracy", f"{stats['avg_accuracy']:.3f}")
     with col4:
-        st.metric("Avg Blur", f"{filtered_df['detected_blur'].mean():.1f}")
+        st.metric("Avg Blur", f"{stats['avg_blur']:.1f}")
     
     st.markdown("---")
     
     # Display mode selection
     display_mode = st.radio(
         "Display Mode:",
-        ["Table View", "Card View", "Image Gallery"]
+        ["Table View", "Card View", "Image Gallery", "Analytics"]
     )
     
+    def shown_image_path(row):
+        # Corrected crop when requested and one exists, else the original
+        if show_deskewed and pd.notna(row['deskewed_path']) and row['deskewed_path'] != "":
+            return row['deskewed_path']
+        return row['image_path']
+
+    render_start = time.perf_counter()
     if display_mode == "Table View":
         st.subheader("📋 Data Table")
-        # Hide the image_path column from display, but keep address columns
-        display_df = filtered_df.drop('image_path', axis=1)
+        # Hide the image_path column from display, but keep the OCR columns
+        display_df = selection.frame().drop(columns=['image_path', 'deskewed_path'], errors='ignore')
         
         # Configure column display
         column_config = {
@@ -114,40 +498,44 @@ def main():
                 max_value=90.0,
                 format="%.1f°"
             ),
-            "address_ocr_v6": st.column_config.TextColumn(
-                "Predicted Address (OCR)",
+            "skew_angle": st.column_config.NumberColumn("Skew (°)", format="%+.2f°"),
+        }
+        for column in filter(None, (text_column, compare_column)):
+            column_version = column.rsplit("_ocr_", 1)[1]
+            column_config[column] = st.column_config.TextColumn(
+                f"Predicted {label} (OCR {column_version})",
                 width="large", 
-                help="Address extracted using OCR"
-            ),
-            "address_ocr_v6_accuracy": st.column_config.NumberColumn(
-                "Address Accuracy",
+                help=f"{label} extracted using OCR {column_version}"
+            )
+            column_config[f"{column}_accuracy"] = st.column_config.NumberColumn(
+                f"{label} Accuracy ({column_version})",
                 min_value=0.0,
                 max_value=1.0,
                 format="%.3f"
             )
-        }
         
         st.dataframe(display_df, use_container_width=True, column_config=column_config)
         
     elif display_mode == "Card View":
         st.subheader("🗃️ Card View")
-        # Sort by detected_blur ascending
-        sorted_df = filtered_df.sort_values(by="detected_blur", ascending=True).reset_index(drop=True)
-        # Pagination
+        # Pagination (the selection is already sorted by detected_blur ascending)
         items_per_page = st.selectbox("Items per page:", [5, 10, 20, 50], index=1)
-        total_pages = len(sorted_df) // items_per_page + (1 if len(sorted_df) % items_per_page > 0 else 0)
+        total_pages = len(selection) // items_per_page + (1 if len(selection) % items_per_page > 0 else 0)
         if total_pages > 0:
             page = st.selectbox("Page:", range(1, total_pages + 1))
             start_idx = (page - 1) * items_per_page
             end_idx = start_idx + items_per_page
-            page_df = sorted_df.iloc[start_idx:end_idx]
-            for idx, row in page_df.iterrows():
+            page_df = selection.page(start_idx, end_idx)
+            for idx, (_, row) in enumerate(page_df.iterrows(), start=start_idx):
                 with st.container():
                     col1, col2 = st.columns([2, 3])  # Made image column larger
                     with col1:
-                        # Display image
+                        # Display image: a cached thumbnail, the original only on request
                         if pd.notna(row['image_path']) and row['image_path'] != "":
-                            image = display_image(row['image_path'])
+                            if st.checkbox("Show original", key=f"card_original_{idx}"):
+                                image = display_image(shown_image_path(row))
+                            else:
+                                image = get_thumbnail(shown_image_path(row), 640, store=thumbnail_store)
                             if image:
                                 st.image(image, caption=f"ID: {row['id']}", use_container_width=True, width=600)
                             else:
@@ -160,19 +548,29 @@ def main():
                         st.write(f"**📁 Upload ID:** {row['upload_id']}")
                         st.write(f"**🌫️ Detected Blur:** {row['detected_blur']:.2f}")
                         st.write(f"**🔄 Detected Angle:** {row['detected_angle']:.1f}°")
-                        st.write(f"**📝 Address OCR Accuracy:** {row['address_ocr_v6_accuracy']:.3f}")
-                        # Address information - displayed directly
-                        st.markdown("**📍 Predicted Address (OCR):**")
-                        if pd.notna(row.get('address_ocr_v6')) and row.get('address_ocr_v6'):
-                            st.text_area("Predicted Address", value=row['address_ocr_v6'], height=80, disabled=True, key=f"pred_addr_{idx}", label_visibility="collapsed")
+                        if 'skew_angle' in row and pd.notna(row['skew_angle']):
+                            st.write(f"**📐 Skew:** {row['skew_angle']:+.2f}°")
+                        if quality_columns:
+                            st.caption(" · ".join(f"{QUALITY_FILTERS[column]}: {row[column]:.3g}" for column in quality_columns))
+                        st.write(f"**📝 {label} OCR Accuracy ({version}):** {row[accuracy_column]:.3f}")
+                        # Predicted text - displayed directly
+                        st.markdown(f"**📍 Predicted {label} (OCR {version}):**")
+                        if pd.notna(row.get(text_column)) and row.get(text_column):
+                            st.text_area(f"Predicted {label}", value=row[text_column], height=80, disabled=True, key=f"pred_addr_{idx}", label_visibility="collapsed")
                         else:
-                            st.info("No predicted address available")
+                            st.info(f"No predicted {label.lower()} available")
+                        if compare_column:
+                            compare_version = compare_column.rsplit("_ocr_", 1)[1]
+                            other_accuracy = row[f"{compare_column}_accuracy"]
+                            st.write(f"**🔀 {label} OCR Accuracy ({compare_version}):** {other_accuracy:.3f} "
+                                     f"({other_accuracy - row[accuracy_column]:+.3f})")
+                            st.markdown(f"**Changes {version} → {compare_version}:** {diff_markdown(row[text_column], row[compare_column])}")
                         # Quality indicators
                         quality_col1, quality_col2 = st.columns(2)
                         with quality_col1:
-                            if row['address_ocr_v6_accuracy'] > 0.8:
+                            if row[accuracy_column] > 0.8:
                                 st.success("🟢 High Accuracy")
-                            elif row['address_ocr_v6_accuracy'] > 0.6:
+                            elif row[accuracy_column] > 0.6:
                                 st.warning("🟡 Medium Accuracy")
                             else:
                                 st.error("🔴 Low Accuracy")
@@ -185,45 +583,69 @@ def main():
                                 st.error("🔴 High Blur")
                     st.markdown("---")
     
+    elif display_mode == "Analytics":
+        st.subheader("📈 Analytics")
+        show_analytics(accuracy_column, label)
+
     elif display_mode == "Image Gallery":
         st.subheader("🖼️ Image Gallery")
-        # Filter only rows with images
-        image_df = filtered_df[filtered_df['image_path'] != ""]
-        # Sort by detected_blur ascending
-        image_df = image_df.sort_values(by="detected_blur", ascending=True).reset_index(drop=True)
-        if len(image_df) == 0:
+        # Only rows with images, still sorted by detected_blur ascending
+        image_selection = selection.with_images()
+        if len(image_selection) == 0:
             st.warning("No images available for the current filters.")
+            instrumentation.record(f"render.{display_mode}", time.perf_counter() - render_start)
+            show_timings(timings_placeholder)
             return
-        # Grid layout
+        # Full-resolution original of the card opened from the gallery
+        opened = st.session_state.get("gallery_open")
+        if opened is not None:
+            with st.container():
+                st.markdown(f"**🔍 Opened card — ID:** {opened['id']}")
+                image = display_image(opened['image_path'])
+                if image:
+                    st.image(image, use_container_width=True)
+                st.button("Close", key="gallery_close", on_click=_close_gallery_card)
+            st.markdown("---")
+        # Grid layout, one page of thumbnails at a time
         cols_per_row = st.selectbox("Images per row:", [2, 3, 4, 5], index=1)  # Changed default to 3 (less columns = larger images)
-        rows = len(image_df) // cols_per_row + (1 if len(image_df) % cols_per_row > 0 else 0)
-        for row_idx in range(rows):
+        rows_per_page = st.selectbox("Rows per page:", [2, 4, 8, 16], index=1)
+        page_size = cols_per_row * rows_per_page
+        total_pages = len(image_selection) // page_size + (1 if len(image_selection) % page_size > 0 else 0)
+        page = st.selectbox("Gallery page:", range(1, total_pages + 1))
+        page_df = image_selection.page((page - 1) * page_size, page * page_size)
+        thumbnail_size = 320 if cols_per_row <= 3 else 160
+        for row_idx in range(0, len(page_df), cols_per_row):
             cols = st.columns(cols_per_row)
             for col_idx in range(cols_per_row):
-                img_idx = row_idx * cols_per_row + col_idx
-                if img_idx < len(image_df):
-                    row_data = image_df.iloc[img_idx]
+                if row_idx + col_idx < len(page_df):
+                    img_idx = (page - 1) * page_size + row_idx + col_idx
+                    row_data = page_df.iloc[row_idx + col_idx]
                     with cols[col_idx]:
-                        image = display_image(row_data['image_path'])
-                        if image:
-                            st.image(image, use_container_width=True, width=300)
+                        thumbnail = get_thumbnail(shown_image_path(row_data), thumbnail_size, store=thumbnail_store)
+                        if thumbnail:
+                            st.image(thumbnail, use_container_width=True, width=300)
+                            st.button("🔍 Open", key=f"gallery_open_{img_idx}", on_click=_open_gallery_card,
+                                      args=(row_data['id'], shown_image_path(row_data)))
                             st.caption(f"**ID:** {row_data['id']}")
-                            st.caption(f"**Accuracy:** {row_data['address_ocr_v6_accuracy']:.3f}")
+                            st.caption(f"**Accuracy:** {row_data[accuracy_column]:.3f}")
                             st.caption(f"**Blur:** {row_data['detected_blur']:.1f}")
                             st.caption(f"**Angle:** {row_data['detected_angle']:.1f}°")
-                            # Address information - displayed directly
-                            st.markdown("**📍 Predicted Address:**")
-                            if pd.notna(row_data.get('address_ocr_v6')) and row_data.get('address_ocr_v6'):
-                                st.text_area("Predicted Address", value=row_data['address_ocr_v6'], height=80, disabled=True, key=f"gallery_addr_{img_idx}", label_visibility="collapsed")
+                            # Predicted text - displayed directly
+                            st.markdown(f"**📍 Predicted {label}:**")
+                            if pd.notna(row_data.get(text_column)) and row_data.get(text_column):
+                                st.text_area(f"Predicted {label}", value=row_data[text_column], height=80, disabled=True, key=f"gallery_addr_{img_idx}", label_visibility="collapsed")
                             else:
-                                st.info("No predicted address")
+                                st.info(f"No predicted {label.lower()}")
     
+    instrumentation.record(f"render.{display_mode}", time.perf_counter() - render_start)
+    show_timings(timings_placeholder)
+
     # Download section
     st.markdown("---")
     st.subheader("💾 Download Filtered Data")
     
     if st.button("Download Filtered CSV"):
-        csv = filtered_df.to_csv(index=False)
+        csv = selection.frame().to_csv(index=False)
         st.download_button(
             label="📥 Download CSV",
             data=csv,
@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from image_validation import probe_image, STATUS_OK
+
+# <path>.u8 holds every crop back to back as raw uint8 pixels, <path>.json the index
+TENSOR_STORE_PATH = "address_images_tensors"
+STORE_VERSION = 2
+
+def data_path(path):
+    return f"{path}.u8"
+
+def index_path(path):
+    return f"{path}.json"
+
+def _load_index(path):
+    try:
+        with open(index_path(path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != STORE_VERSION:
+        return None
+    return index
+
+def _save_index(path, width, entries):
+    tmp_path = f"{index_path(path)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": STORE_VERSION, "width": width, "entries": entries}, f)
+    os.replace(tmp_path, index_path(path))
+
+class TensorStore:
+    """
+    Read side of the store: grayscale crops as zero-copy views into one
+    memory-mapped file, looked up by upload_id or by source image path.
+    """
+
+    def __init__(self, path=TENSOR_STORE_PATH):
+        index = _load_index(path) or {"width": None, "entries": {}}
+        self.path = path
+        # Width every crop was resized to, or None for native resolution
+        self.width = index["width"]
+        self.entries = index["entries"]
+        self._by_source = {entry["source"]: upload_id for upload_id, entry in self.entries.items()}
+        data_file = data_path(path)
+        has_data = os.path.exists(data_file) and os.path.getsize(data_file) > 0
+        self.data = np.memmap(data_file, dtype=np.uint8, mode="r") if has_data else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, upload_id):
+        return upload_id in self.entries
+
+    def get(self, upload_id):
+        """The stored crop of upload_id as a (height, width) uint8 view, or None"""
+        entry = self.entries.get(upload_id)
+        if entry is None or self.data is None:
+            return None
+        start = entry["offset"]
+        stop = start + entry["height"] * entry["width"]
+        return self.data[start:stop].reshape(entry["height"], entry["width"])
+
+    def load(self, image_path):
+        """
+        The stored crop of image_path if the file has not changed since it was
+        stored (same size and mtime), else None so the caller decodes it itself.
+        """
+        upload_id = self._by_source.get(image_path)
+        if upload_id is None:
+            return None
+        entry = self.entries[upload_id]
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime_ns"]:
+            return None
+        return self.get(upload_id)
+
+    def source_width(self, image_path):
+        """Width of image_path before it was resized into the store, or None if not stored"""
+        upload_id = self._by_source.get(image_path)
+        return self.entries[upload_id]["source_width"] if upload_id is not None else None
+
+def _decode(image_path, width):
+    """
+    (grayscale crop as check.load_grayscale decodes it, its original width),
+    the crop optionally resized to width; None if it cannot be decoded
+    """
+    # OpenCV is only needed to build the store; readers (e.g. the viewer) need just numpy
+    import cv2
+
+    if probe_image(image_path)["status"] != STATUS_OK:
+        return None
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    source_width = gray.shape[1]
+    if width and source_width != width:
+        height = max(1, round(gray.shape[0] * width / source_width))
+        gray = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(gray), source_width
+
+def _publish(path, new_data_file, width, entries):
+    """
+    Swap a rewritten data file in with its index. The data file is replaced,
+    never truncated, so readers still mapping the old one are unaffected. The
+    old index goes first: an interrupted swap leaves an empty store rather
+    than an index pointing at the wrong offsets.
+    """
+    if os.path.exists(index_path(path)):
+        os.remove(index_path(path))
+    os.replace(new_data_file, data_path(path))
+    _save_index(path, width, entries)
+
+def _compact(path, entries):
+    """Copy only the live crops to a new data file; returns (its path, the moved entries)"""
+    old = np.memmap(data_path(path), dtype=np.uint8, mode="r")
+    tmp_path = f"{data_path(path)}.tmp"
+    compacted = {}
+    with open(tmp_path, "wb") as f:
+        for upload_id, entry in entries.items():
+            length = entry["height"] * entry["width"]
+            compacted[upload_id] = {**entry, "offset": f.tell()}
+            f.write(old[entry["offset"]:entry["offset"] + length].tobytes())
+    del old
+    return tmp_path, compacted
+
+def build_tensor_store(images, path=TENSOR_STORE_PATH, width=None, workers=8, rebuild=False):
+    """
+    Decode (upload_id, image_path) pairs once into the store at path.
+    Crops whose source is unchanged are kept; new or changed ones are appended.
+    Entries for images no longer listed are dropped, and the data file is
+    compacted once more than half of it is dead. width resizes every crop
+    to that width (aspect kept); None stores them at native resolution, so
+    analysis results are the same as from the files. Returns a TensorStore.
+    """
+    images = list(images)
+    index = None if rebuild else _load_index(path)
+    # New crops are appended to the current data file, or written to a new one
+    # that replaces it at the end when starting over
+    fresh = index is None or index["width"] != width or not os.path.exists(data_path(path))
+    if fresh:
+        index = {"width": width, "entries": {}}
+    target = f"{data_path(path)}.tmp" if fresh else data_path(path)
+
+    entries = {}
+    todo = []
+    for upload_id, image_path in images:
+        old = index["entries"].get(upload_id)
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            continue
+        if old and old["source"] == image_path and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            entries[upload_id] = old
+        else:
+            todo.append((upload_id, image_path, stat))
+
+    failed = 0
+    # imread releases the GIL, so threads decode in parallel without pickling arrays
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(target, "wb" if fresh else "ab") as f:
+        decoded = executor.map(lambda item: _decode(item[1], width), todo)
+        for (upload_id, image_path, stat), result in zip(todo, decoded):
+            if result is None:
+                failed += 1
+                continue
+            gray, source_width = result
+            entries[upload_id] = {
+                "offset": f.tell(), "height": gray.shape[0], "width": gray.shape[1], "source_width": source_width,
+                "source": image_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            }
+            f.write(gray.tobytes())
+
+    live = sum(entry["height"] * entry["width"] for entry in entries.values())
+    if fresh:
+        _publish(path, target, width, entries)
+    elif os.path.getsize(data_path(path)) > 2 * live:
+        compacted_file, entries = _compact(path, entries)
+        _publish(path, compacted_file, width, entries)
+    else:
+        # Appended bytes are only referenced once the index is saved
+        _save_index(path, width, entries)
+
+    print(f"Tensor store {path}: {len(entries)} crops ({live / 1e6:.1f} MB), "
+          f"added {len(todo) - failed}, unreadable {failed}")
+    return TensorStore(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mapped grayscale crop store")
+    parser.add_argument("--image-dir", default="address images")
+    parser.add_argument("--path", default=TENSOR_STORE_PATH)
+    parser.add_argument("--width", type=int, default=None, help="resize every crop to this width")
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    names = sorted(name for name in os.listdir(args.image_dir) if name.lower().endswith(".png"))
+    build_tensor_store(((os.path.splitext(name)[0], os.path.join(args.image_dir, name)) for name in names),
+                       args.path, args.width, rebuild=args.rebuild)
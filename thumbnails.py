@@ -0,0 +1,112 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from nid_storage import read_table
+from tensor_store import TensorStore
+
+THUMBNAIL_DIR = ".thumbnails"
+# Bounding box (pixels) of each pyramid level, largest first
+THUMBNAIL_SIZES = (640, 320, 160)
+
+def thumbnail_path(image_path, size, signature, thumbnail_dir=THUMBNAIL_DIR, grayscale=False):
+    """
+    Cache location of one thumbnail. The name is derived from the source path and
+    its (mtime_ns, size) signature, so an edited image gets a fresh thumbnail.
+    Grayscale thumbnails made from the tensor store are kept apart from colour ones.
+    """
+    variant = "|gray" if grayscale else ""
+    key = hashlib.blake2b(f"{os.path.abspath(image_path)}|{signature[0]}|{signature[1]}{variant}".encode("utf-8"),
+                          digest_size=16).hexdigest()
+    return os.path.join(thumbnail_dir, str(size), f"{key}.webp")
+
+def _signature(image_path):
+    stat = os.stat(image_path)
+    return stat.st_mtime_ns, stat.st_size
+
+def _save_webp(image, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path, format="WEBP", quality=80, method=4)
+    os.replace(tmp_path, path)
+
+def build_pyramid(image_path, thumbnail_dir=THUMBNAIL_DIR, sizes=THUMBNAIL_SIZES, store=None):
+    """
+    Decode an image once and write every missing thumbnail size.
+    Each level is downscaled from the previous one, not from the original.
+    With a TensorStore holding the image, the levels are made from its stored
+    grayscale crop instead of decoding the file.
+    Returns {size: thumbnail path}, or None if the image cannot be read.
+    """
+    try:
+        signature = _signature(image_path)
+    except OSError:
+        return None
+    gray = store.load(image_path) if store is not None else None
+    paths = {size: thumbnail_path(image_path, size, signature, thumbnail_dir, gray is not None) for size in sizes}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    if gray is not None:
+        level = Image.fromarray(gray, mode="L")
+    else:
+        try:
+            with Image.open(image_path) as img:
+                img.load()
+                level = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        except Exception as e:
+            print(f"Error: Could not read image {image_path}: {e}")
+            return None
+
+    for size in sorted(sizes, reverse=True):
+        level.thumbnail((size, size), Image.LANCZOS)
+        if not os.path.exists(paths[size]):
+            _save_webp(level, paths[size])
+    return paths
+
+def get_thumbnail(image_path, size=320, thumbnail_dir=THUMBNAIL_DIR, store=None):
+    """Path to the cached thumbnail of image_path, building the pyramid on first use"""
+    paths = build_pyramid(image_path, thumbnail_dir, store=store)
+    if paths is None:
+        return None
+    return paths.get(size) or paths[min(paths, key=lambda s: abs(s - size))]
+
+# Store mapped by a build_thumbnails worker process
+_worker_store = None
+
+def _build_from_store(image_path, thumbnail_dir, tensor_store_path):
+    # Each worker maps the store once
+    global _worker_store
+    if _worker_store is None or _worker_store.path != tensor_store_path:
+        _worker_store = TensorStore(tensor_store_path)
+    return build_pyramid(image_path, thumbnail_dir, store=_worker_store)
+
+def build_thumbnails(image_paths, thumbnail_dir=THUMBNAIL_DIR, workers=None, tensor_store_path=None):
+    """
+    Precompute the thumbnail pyramid for many images over a process pool.
+    With tensor_store_path, images in that store are read from it (grayscale).
+    """
+    image_paths = [path for path in image_paths if isinstance(path, str) and path]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if tensor_store_path:
+            built = list(executor.map(_build_from_store, image_paths, [thumbnail_dir] * len(image_paths),
+                                      [tensor_store_path] * len(image_paths), chunksize=16))
+        else:
+            built = list(executor.map(build_pyramid, image_paths, [thumbnail_dir] * len(image_paths), chunksize=16))
+    failed = sum(1 for paths in built if paths is None)
+    print(f"Thumbnails ready for {len(built) - failed} images ({failed} failed) in {thumbnail_dir}")
+
+if __name__ == "__main__":
+    # The merged data file the viewer shows: NID_DATA_FILE, else the newest of
+    # the Parquet and CSV outputs
+    candidates = tuple(filter(None, os.environ.get("NID_DATA_FILE", "").split(os.pathsep))) or \
+        ("filtered_nid_data_with_images.parquet", "filtered_nid_data_with_images.csv")
+    existing = [path for path in candidates if os.path.exists(path)]
+    if not existing:
+        raise SystemExit(f"Error: none of {', '.join(candidates)} exists")
+    data_file = max(existing, key=lambda path: os.stat(path).st_mtime_ns)
+    print(f"Building thumbnails for {data_file}")
+    df = read_table(data_file, columns=["image_path"])
+    build_thumbnails(df["image_path"].dropna().unique())
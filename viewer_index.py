@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+class SortedColumn:
+    """
+    Row positions of one numeric column sorted by value, NaNs excluded.
+    selectable (boolean per row) limits covers() to the rows a selection can
+    contain at all, so values of rows that are never shown do not count.
+    """
+
+    def __init__(self, values, selectable=None):
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(values, kind="stable")
+        valid = int(np.count_nonzero(~np.isnan(values)))
+        self.order = order[:valid]
+        self.values = values[self.order]
+        considered = values if selectable is None else values[selectable]
+        present = considered[~np.isnan(considered)]
+        self.has_nan = len(present) < len(considered)
+        self.bounds = (present.min(), present.max()) if len(present) else None
+
+    def range(self, low=None, high=None):
+        """Row positions with low <= value <= high, in value order (binary search, no copy)"""
+        start = 0 if low is None else np.searchsorted(self.values, low, side="left")
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, side="right")
+        return self.order[start:stop]
+
+    def covers(self, low=None, high=None):
+        """Whether [low, high] keeps every row, i.e. the filter is a no-op"""
+        if self.has_nan:
+            return False
+        if self.bounds is None:
+            return True
+        return (low is None or low <= self.bounds[0]) and (high is None or high >= self.bounds[1])
+
+class Selection:
+    """Filtered rows of a ViewerIndex, kept in ascending-blur order"""
+
+    def __init__(self, index, rows, blur_range=None):
+        self.index = index
+        self.rows = rows
+        # (start, stop) in the blur-sorted arrays when rows is a plain blur range,
+        # which lets the summary metrics come from prefix sums
+        self.blur_range = blur_range
+
+    def __len__(self):
+        return len(self.rows)
+
+    def page(self, start, stop):
+        """Rows start:stop of the blur-sorted selection as a DataFrame"""
+        return self.index.df.iloc[self.rows[start:stop]]
+
+    def frame(self):
+        """The whole selection in original row order (for the table and downloads)"""
+        return self.index.df.iloc[np.sort(self.rows)]
+
+    def with_images(self):
+        """The rows of this selection that have an image, still in blur order"""
+        index = self.index
+        if self.blur_range is not None:
+            start, stop = self.blur_range
+            first = np.searchsorted(index.image_positions, start, side="left")
+            last = np.searchsorted(index.image_positions, stop, side="left")
+            return Selection(index, index.by_blur.order[index.image_positions[first:last]])
+        return Selection(index, self.rows[index.has_image[self.rows]])
+
+    def metrics(self):
+        """Total records, records with images, mean accuracy and mean blur"""
+        index = self.index
+        if self.blur_range is not None:
+            start, stop = self.blur_range
+            def total(prefix):
+                return prefix[stop] - prefix[start]
+            count = stop - start
+            accuracy_count = total(index.accuracy_count_prefix)
+            return {
+                'count': count,
+                'with_images': int(total(index.has_image_prefix)),
+                'avg_accuracy': total(index.accuracy_prefix) / accuracy_count if accuracy_count else float("nan"),
+                'avg_blur': total(index.blur_prefix) / count if count else float("nan"),
+            }
+        rows = self.rows
+        accuracy = index.accuracy[rows]
+        return {
+            'count': len(rows),
+            'with_images': int(np.count_nonzero(index.has_image[rows])),
+            'avg_accuracy': float(np.nanmean(accuracy)) if np.any(~np.isnan(accuracy)) else float("nan"),
+            'avg_blur': float(index.blur[rows].mean()) if len(rows) else float("nan"),
+        }
+
+class ViewerIndex:
+    """
+    Precomputed sorted views of the viewer data.
+
+    Built once per data file. A blur or accuracy threshold becomes a binary
+    search into a sorted array, so with only the blur filter active a page of
+    results costs O(log n + page size). Selections are always returned in
+    ascending-blur order, the order used by Card View and Image Gallery.
+    """
+
+    def __init__(self, df, accuracy_column="address_ocr_v6_accuracy", text_column="address_ocr_v6"):
+        self.df = df
+        self.blur = df['detected_blur'].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.accuracy = df[accuracy_column].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.angle = df['detected_angle'].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.has_image = (df['image_path'].notna() & (df['image_path'] != "")).to_numpy(dtype=bool)
+        self.image_rows = np.flatnonzero(self.has_image)
+        self.text = df[text_column].astype(pd.StringDtype("pyarrow")).fillna("") if text_column in df.columns else None
+
+        self.by_blur = SortedColumn(self.blur)
+        # Rows with missing blur are never selected (see select)
+        self.selectable = ~np.isnan(self.blur)
+        self.by_accuracy = SortedColumn(self.accuracy, self.selectable)
+        self.by_angle = SortedColumn(self.angle, self.selectable)
+        # Other numeric columns (image-quality metrics), sorted on first use
+        self._columns = {}
+        # Position of every row in blur order, to re-sort other candidate sets cheaply
+        self.blur_rank = np.full(len(df), len(df), dtype=np.int64)
+        self.blur_rank[self.by_blur.order] = np.arange(len(self.by_blur.order))
+
+        # Prefix sums over the blur-sorted rows for O(1) summary metrics
+        order = self.by_blur.order
+        accuracy = self.accuracy[order]
+        self.blur_prefix = np.concatenate(([0.0], np.cumsum(self.blur[order])))
+        self.accuracy_prefix = np.concatenate(([0.0], np.cumsum(np.nan_to_num(accuracy))))
+        self.accuracy_count_prefix = np.concatenate(([0], np.cumsum(~np.isnan(accuracy))))
+        self.has_image_prefix = np.concatenate(([0], np.cumsum(self.has_image[order])))
+        # Positions in blur order of the rows that have an image
+        self.image_positions = np.flatnonzero(self.has_image[order])
+
+    def column(self, name):
+        """(values, SortedColumn) of any numeric column, built once per index"""
+        if name not in self._columns:
+            values = self.df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+            self._columns[name] = (values, SortedColumn(values, self.selectable))
+        return self._columns[name]
+
+    def select(self, min_accuracy=None, min_blur=None, angle_range=None, text=None, mask=None, ranges=None):
+        """
+        Rows with accuracy >= min_accuracy, blur >= min_blur, angle within
+        angle_range (inclusive), every column in ranges within its (low, high),
+        text containing the search string and, if given, True in the boolean
+        row mask (e.g. a version diff).
+        Rows with missing blur are never selected, matching the viewer's filters.
+        """
+        blur_start = 0 if min_blur is None else int(np.searchsorted(self.by_blur.values, min_blur, side="left"))
+        blur_stop = len(self.by_blur.values)
+        rows = self.by_blur.order[blur_start:blur_stop]
+
+        accuracy_active = min_accuracy is not None and not self.by_accuracy.covers(min_accuracy)
+        angle_active = angle_range is not None and not self.by_angle.covers(*angle_range)
+        active_ranges = [
+            (self.column(name)[0], low, high)
+            for name, (low, high) in (ranges or {}).items()
+            if not self.column(name)[1].covers(low, high)
+        ]
+        if not (accuracy_active or angle_active or active_ranges or text or mask is not None):
+            return Selection(self, rows, blur_range=(blur_start, blur_stop))
+
+        if accuracy_active:
+            accuracy_rows = self.by_accuracy.range(min_accuracy)
+            if len(accuracy_rows) < len(rows):
+                # Fewer rows pass the accuracy filter: start from those and put them in blur order
+                ranks = self.blur_rank[accuracy_rows]
+                rows = accuracy_rows[(ranks >= blur_start) & (ranks < blur_stop)]
+                rows = rows[np.argsort(self.blur_rank[rows], kind="stable")]
+            else:
+                rows = rows[self.accuracy[rows] >= min_accuracy]
+        if angle_active:
+            low, high = angle_range
+            rows = rows[(self.angle[rows] >= low) & (self.angle[rows] <= high)]
+        for values, low, high in active_ranges:
+            rows = rows[(values[rows] >= low) & (values[rows] <= high)]
+        if mask is not None:
+            rows = rows[mask[rows]]
+        if text:
+            matches = self.text.iloc[rows].str.contains(text, case=False, regex=False).to_numpy(dtype=bool)
+            rows = rows[matches]
+        return Selection(self, rows)